@@ -1,22 +1,178 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+from flask_caching import Cache
 import os
 import csv
 import io
+import functools
+import hashlib
+import secrets
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pipeline import run, run_on_image
+from capture import warm_up_browsers
 from config import setup_environment
 
+# orjson is optional - fall back to Flask's stdlib JSON provider without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+@functools.lru_cache(maxsize=1)
+def _load_env_once():
+    """Load tokens from config files once per process instead of on every request"""
+    setup_environment()
+
 # Setup environment variables from config files
-setup_environment()
+_load_env_once()
+
+# Start Playwright + Chromium on the capture threads in the background at startup
+if os.environ.get('CAPTURE_PREWARM') == '1':
+    warm_up_browsers()
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider using orjson's C encoder/decoder for large batch payloads"""
+    def dumps(self, obj, **kwargs):
+        # Honour the provider's sort_keys (app.json.sort_keys, default True) and the
+        # indent Flask passes for pretty-printed debug responses, like the stdlib provider
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 app = Flask(__name__)
+# Reject oversized uploads (CSV/image) before they are buffered - MAX_UPLOAD_MB, default 25
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_MB', 25)) * 1024 * 1024
 CORS(app)  # Enable CORS for frontend
+if orjson is not None:
+    app.json = ORJSONProvider(app)
+
+# Response cache - shared across workers when CACHE_REDIS_URL is set, per-process otherwise
+if os.environ.get('CACHE_REDIS_URL'):
+    cache = Cache(app, config={'CACHE_TYPE': 'RedisCache', 'CACHE_REDIS_URL': os.environ['CACHE_REDIS_URL']})
+else:
+    cache = Cache(app, config={'CACHE_TYPE': 'SimpleCache'})
+
+# How long (seconds) a successful extraction for the same URL + fields is reused
+EXTRACT_CACHE_TIMEOUT = int(os.environ.get('EXTRACT_CACHE_TIMEOUT', 600))
+
+# Number of URLs processed concurrently by the multi-URL endpoints.
+# Each run is dominated by browser/network/model I/O, so threads overlap well.
+EXTRACT_CONCURRENCY = max(1, int(os.environ.get('EXTRACT_CONCURRENCY', 4)))
+_executor = ThreadPoolExecutor(max_workers=EXTRACT_CONCURRENCY)
+
+def _run_cached(url, fields):
+    """Run the pipeline, reusing a recent successful result for the same URL and fields"""
+    key = 'extract:' + hashlib.sha256(f"{url}|{','.join(sorted(fields or []))}".encode()).hexdigest()
+    result = cache.get(key)
+    if result is None:
+        result = run(url, fields=fields)
+        if not result.get('error'):
+            cache.set(key, result, timeout=EXTRACT_CACHE_TIMEOUT)
+    return dict(result)
+
+def _process_one(url, fields):
+    """Run the pipeline for one URL, returning an error result instead of raising"""
+    try:
+        result = _run_cached(url, fields)
+        result['url'] = url
+        return result
+    except Exception as e:
+        return {
+            'url': url,
+            'error': str(e),
+            'success': False
+        }
+
+def _process_urls(urls, fields):
+    """Process URLs concurrently, preserving input order in the results"""
+    # Run each distinct URL once and fan the result back out to every duplicate
+    unique = list(dict.fromkeys(urls))
+    by_url = dict(zip(unique, _executor.map(lambda u: _process_one(u, fields), unique)))
+    return [dict(by_url[u]) for u in urls]
+
+def _wants_ndjson():
+    """Clients opt into streamed batch results with ?stream=1 or Accept: application/x-ndjson"""
+    return request.args.get('stream') == '1' or request.accept_mimetypes.best == 'application/x-ndjson'
+
+def _stream_results(urls, fields):
+    """Stream one JSON line per URL as soon as its result is ready (completion order)"""
+    counts = Counter(urls)
+    
+    def generate():
+        futures = [_executor.submit(_process_one, u, fields) for u in counts]
+        for future in as_completed(futures):
+            result = future.result()
+            line = app.json.dumps(result) + '\n'
+            # Duplicates of a URL share one run but still get one line each
+            for _ in range(counts[result['url']]):
+                yield line
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
+# Background batch jobs: a small pool runs whole batches (each fanning out on _executor)
+# and job state lives in the cache, so any worker sharing CACHE_REDIS_URL can report it
+JOB_RESULT_TIMEOUT = int(os.environ.get('JOB_RESULT_TIMEOUT', 3600))
+_job_executor = ThreadPoolExecutor(max_workers=max(1, int(os.environ.get('JOB_WORKERS', 2))))
+
+def _run_batch_job(job_id, urls, fields):
+    """Process a batch in the background and store its results under the job id"""
+    cache.set(f'job:{job_id}', {'status': 'running', 'count': len(urls)}, timeout=JOB_RESULT_TIMEOUT)
+    try:
+        results = _process_urls(urls, fields)
+        job = {'status': 'finished', 'data': results, 'count': len(results)}
+    except Exception as e:
+        job = {'status': 'failed', 'error': str(e)}
+    cache.set(f'job:{job_id}', job, timeout=JOB_RESULT_TIMEOUT)
+
+def _parse_fields(raw):
+    """Normalise a fields value (comma-separated string or list) to a clean list, or None for defaults"""
+    if not raw:
+        return None
+    if isinstance(raw, str):
+        raw = raw.split(',')
+    return [f.strip() for f in raw if f and f.strip()] or None
+
+def _get_json_body():
+    """Parse the JSON request body (through app.json, i.e. orjson when installed)"""
+    # cache=False: each endpoint reads the body once, so don't keep a parsed copy on the request
+    data = request.get_json(silent=True, cache=False)
+    return data if isinstance(data, dict) else None
+
+_HTTP_PREFIXES = ('http://', 'https://')
+
+def _iter_csv_urls(file_stream):
+    """Yield URLs from the first CSV column, decoding the upload row by row"""
+    text_stream = io.TextIOWrapper(file_stream, encoding='utf-8', newline='')
+    try:
+        for row in csv.reader(text_stream):
+            url = row[0].strip() if row else ''
+            if url.startswith(_HTTP_PREFIXES):
+                yield url
+    finally:
+        # Hand the underlying stream back to Werkzeug instead of closing it
+        text_stream.detach()
 
 # Ensure token is loaded before every request (important for Flask reloader)
 @app.before_request
 def ensure_token_loaded():
-    """Ensure token is loaded before each request"""
-    setup_environment()
+    """Ensure token is loaded before each request (no-op after the first load)"""
+    _load_env_once()
+
+@app.errorhandler(413)
+def request_too_large(e):
+    """Return JSON (like the other API errors) when an upload exceeds MAX_CONTENT_LENGTH"""
+    return jsonify({
+        'success': False,
+        'error': f"Upload too large (limit {app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)} MB)"
+    }), 413
 
 @app.route('/')
 def index():
@@ -26,35 +182,19 @@ def index():
 def extract_fields():
     """API endpoint to extract fields from a product URL or multiple URLs"""
     try:
-        # Ensure token is loaded (in case it wasn't loaded yet)
-        setup_environment()
-        
-        data = request.get_json()
+        data = _get_json_body()
+        if data is None:
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
         url = data.get('url')
         urls = data.get('urls', [])
-        fields = data.get('fields', [])
-        
-        # If fields is a string, split by comma
-        if isinstance(fields, str):
-            fields = [f.strip() for f in fields.split(',') if f.strip()]
-        elif not fields:
-            fields = None  # Use default
+        fields = _parse_fields(data.get('fields'))
         
         # Handle multiple URLs
         if urls and len(urls) > 0:
-            results = []
-            for url_item in urls:
-                if url_item and url_item.strip():
-                    try:
-                        result = run(url_item.strip(), fields=fields)
-                        result['url'] = url_item.strip()
-                        results.append(result)
-                    except Exception as e:
-                        results.append({
-                            'url': url_item.strip(),
-                            'error': str(e),
-                            'success': False
-                        })
+            urls = [u.strip() for u in urls if u and u.strip()]
+            if _wants_ndjson():
+                return _stream_results(urls, fields)
+            results = _process_urls(urls, fields)
             
             return jsonify({
                 'success': True,
@@ -67,7 +207,7 @@ def extract_fields():
             return jsonify({'error': 'URL is required'}), 400
         
         # Run the pipeline
-        result = run(url, fields=fields)
+        result = _run_cached(url, fields)
         
         return jsonify({
             'success': True,
@@ -83,34 +223,19 @@ def extract_fields():
 def extract_batch():
     """API endpoint to extract fields from multiple URLs (batch processing)"""
     try:
-        setup_environment()
-        
-        data = request.get_json()
+        data = _get_json_body()
+        if data is None:
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
         urls = data.get('urls', [])
-        fields = data.get('fields', [])
+        fields = _parse_fields(data.get('fields'))
         
         if not urls or len(urls) == 0:
             return jsonify({'error': 'URLs are required'}), 400
         
-        # If fields is a string, split by comma
-        if isinstance(fields, str):
-            fields = [f.strip() for f in fields.split(',') if f.strip()]
-        elif not fields:
-            fields = None
-        
-        results = []
-        for url in urls:
-            if url and url.strip():
-                try:
-                    result = run(url.strip(), fields=fields)
-                    result['url'] = url.strip()
-                    results.append(result)
-                except Exception as e:
-                    results.append({
-                        'url': url.strip(),
-                        'error': str(e),
-                        'success': False
-                    })
+        urls = [u.strip() for u in urls if u and u.strip()]
+        if _wants_ndjson():
+            return _stream_results(urls, fields)
+        results = _process_urls(urls, fields)
         
         return jsonify({
             'success': True,
@@ -123,12 +248,47 @@ def extract_batch():
             'error': str(e)
         }), 500
 
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    """API endpoint to queue a batch extraction and return immediately with a job id"""
+    try:
+        data = _get_json_body()
+        if data is None:
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
+        urls = data.get('urls', [])
+        fields = _parse_fields(data.get('fields'))
+        
+        urls = [u.strip() for u in urls if u and u.strip()]
+        if not urls:
+            return jsonify({'error': 'URLs are required'}), 400
+        
+        job_id = secrets.token_hex(16)
+        cache.set(f'job:{job_id}', {'status': 'queued', 'count': len(urls)}, timeout=JOB_RESULT_TIMEOUT)
+        _job_executor.submit(_run_batch_job, job_id, urls, fields)
+        
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status_url': f'/api/jobs/{job_id}'
+        }), 202
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get status (queued/running/finished/failed) and results of a batch job"""
+    job = cache.get(f'job:{job_id}')
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found or expired'}), 404
+    return jsonify({'success': job['status'] != 'failed', 'job_id': job_id, **job})
+
 @app.route('/api/upload-csv', methods=['POST'])
 def upload_csv():
     """API endpoint to extract fields from URLs in a CSV file"""
     try:
-        setup_environment()
-        
         if 'file' not in request.files:
             return jsonify({'error': 'No file uploaded'}), 400
         
@@ -140,40 +300,18 @@ def upload_csv():
             return jsonify({'error': 'File must be a CSV file'}), 400
         
         # Get fields from form data
-        fields = request.form.get('fields', '')
-        if fields:
-            fields = [f.strip() for f in fields.split(',') if f.strip()]
-        else:
-            fields = None
-        
-        # Read CSV file
-        stream = io.StringIO(file.stream.read().decode("UTF8"), newline=None)
-        csv_reader = csv.reader(stream)
+        fields = _parse_fields(request.form.get('fields'))
         
         # Extract URLs from CSV (assuming first column contains URLs)
-        urls = []
-        for row in csv_reader:
-            if row and len(row) > 0 and row[0].strip():
-                url = row[0].strip()
-                if url.startswith('http://') or url.startswith('https://'):
-                    urls.append(url)
+        urls = list(_iter_csv_urls(file.stream))
         
         if not urls:
             return jsonify({'error': 'No valid URLs found in CSV file'}), 400
         
         # Process all URLs
-        results = []
-        for url in urls:
-            try:
-                result = run(url, fields=fields)
-                result['url'] = url
-                results.append(result)
-            except Exception as e:
-                results.append({
-                    'url': url,
-                    'error': str(e),
-                    'success': False
-                })
+        if _wants_ndjson():
+            return _stream_results(urls, fields)
+        results = _process_urls(urls, fields)
         
         return jsonify({
             'success': True,
@@ -190,8 +328,6 @@ def upload_csv():
 def upload_image():
     """API endpoint to extract fields from an uploaded image"""
     try:
-        setup_environment()
-        
         if 'file' not in request.files:
             return jsonify({'error': 'No file uploaded'}), 400
         
@@ -200,40 +336,16 @@ def upload_image():
             return jsonify({'error': 'No file selected'}), 400
         
         # Get fields from form data
-        fields = request.form.get('fields', '')
-        if fields:
-            fields = [f.strip() for f in fields.split(',') if f.strip()]
-        else:
-            fields = None
-            
-        # Ensure uploads directory exists
-        upload_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
-        if not os.path.exists(upload_dir):
-            os.makedirs(upload_dir)
+        fields = _parse_fields(request.form.get('fields'))
             
-        # Save temporary file
-        from werkzeug.utils import secure_filename
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(upload_dir, filename)
-        file.save(file_path)
+        # OCR reads file-like objects directly, so hand over Werkzeug's upload
+        # stream (already spooled and seekable) without saving or copying it
+        result = run_on_image(file.stream, fields=fields)
         
-        # Run extraction on image
-        try:
-            result = run_on_image(file_path, fields=fields)
-            
-            # Clean up file
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                
-            return jsonify({
-                'success': True,
-                'data': result
-            })
-        except Exception as e:
-            # Clean up even on error
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            raise e
+        return jsonify({
+            'success': True,
+            'data': result
+        })
             
     except Exception as e:
         return jsonify({
@@ -242,6 +354,7 @@ def upload_image():
         }), 500
 
 @app.route('/api/fields', methods=['GET'])
+@cache.cached(timeout=3600)
 def get_available_fields():
     """Get list of available predefined fields"""
     from pipeline import FIELD_DEFINITIONS
@@ -259,7 +372,7 @@ def get_available_fields():
     })
 
 if __name__ == '__main__':
-    # Token is already loaded by setup_environment() above
+    # Token is already loaded by _load_env_once() above
     # Just check and warn if still not set
     if not os.environ.get('HF_TOKEN') and not os.environ.get('MISTRAL_API_KEY'):
         print("\n" + "="*60)
@@ -274,5 +387,6 @@ if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5010))
     print(f"\n[OK] Starting Flask server on http://localhost:{port}")
     print("--> Open http://localhost:5010 in your browser\n")
-    app.run(debug=True, host='0.0.0.0', port=port)
+    print("Development server only - use wsgi.py with gunicorn/waitress in production\n")
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1', host='0.0.0.0', port=port, threaded=True)
 
@@ -1,90 +1,553 @@
 import os
+import asyncio
+import copy
+import functools
+import gzip
+import queue
+import random
+import threading
+import time
 import requests
 import json
+from concurrent.futures import Future, ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+# orjson is optional - fall back to stdlib json for API payloads without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# torch is only needed for the local model; API-only installs work without it
+try:
+    import torch
+except ImportError:
+    torch = None
 
 MODEL = "mistralai/Mistral-7B-Instruct-v0.2"  # <--- replace with correct model id or mixtral id
 
+# Shared HTTP session for the Mistral / HF APIs: keeps TCP+TLS connections alive between calls.
+# No urllib3 retries - call_mistral_api / call_hf_inference handle 429s and backoff themselves.
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=0))
+_session.headers.update({"Content-Type": "application/json"})
+
+# Threads for racing backends in call_hf_inference_async. Not the event loop's default
+# executor, so asyncio.run() returns as soon as one backend wins instead of joining the losers.
+_backend_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="model-backend")
+
+def _dumps(payload):
+    """Serialize an API request body to bytes"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload).encode("utf-8")
+
+# Request bodies above this size are gzip-compressed when API_GZIP_REQUESTS=1
+# (below ~one packet compression only adds CPU time)
+GZIP_MIN_BYTES = 4096
+
+def _encode_body(payload, headers):
+    """Serialize a request body, gzip-compressing large ones if enabled; adds Content-Encoding to headers"""
+    data = _dumps(payload)
+    if os.environ.get("API_GZIP_REQUESTS") == "1" and len(data) > GZIP_MIN_BYTES:
+        # Level 1 gets most of the ratio on JSON text at a fraction of the CPU cost
+        data = gzip.compress(data, compresslevel=1)
+        headers["Content-Encoding"] = "gzip"
+    return data
+
+def _loads(content):
+    """Parse an API response body"""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+# transformers is imported on first use - it is slow to import and API-only paths never need it
+_transformers_cache = None
+
+def _lazy_transformers():
+    """Import transformers once and reuse the module afterwards"""
+    global _transformers_cache
+    if _transformers_cache is None:
+        import transformers
+        _transformers_cache = transformers
+    return _transformers_cache
+
 # Global variables for local model
 _local_model = None
 _local_tokenizer = None
 _model_loaded = False
+_local_device = None
+_eos_id = None
+_has_chat_template = False
+_prefix_ids = None
+_prompt_seam = ""
+_suffix_ids = None
+_use_static_cache = False
+_cb_manager = None
+_batcher = None
 
-def get_local_model_path():
-    """Get the path to the local model directory"""
+def _probe_local_model_path():
     current_dir = os.path.dirname(os.path.abspath(__file__))
     model_index = os.path.join(current_dir, "model.safetensors.index.json")
     if os.path.exists(model_index):
         return current_dir
     return None
 
+# Resolved at import; call get_local_model_path(refresh=True) after adding/removing model files
+_LOCAL_MODEL_PATH = _probe_local_model_path()
+
+def get_local_model_path(refresh: bool = False):
+    """Get the path to the local model directory (None if no local model)"""
+    global _LOCAL_MODEL_PATH
+    if refresh:
+        _LOCAL_MODEL_PATH = _probe_local_model_path()
+    return _LOCAL_MODEL_PATH
+
 def load_local_model():
     """Load the local Mistral model from disk"""
     global _local_model, _local_tokenizer, _model_loaded
+    global _local_device, _eos_id, _has_chat_template, _batcher, _prefix_ids, _prompt_seam, _suffix_ids
     
     if _model_loaded:
         return _local_model, _local_tokenizer
     
+    # Keep torch.compile artifacts next to the model so restarts skip the cold compile
+    os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR",
+                          os.path.join(os.path.dirname(os.path.abspath(__file__)), ".torch_compile_cache"))
+    os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
+    
     try:
         model_path = get_local_model_path()
         if not model_path:
             return None, None
         
+        if torch is None:
+            print("PyTorch is not installed - local model unavailable")
+            return None, None
+        
         print(f"Loading local model from: {model_path}")
         
-        from transformers import AutoModelForCausalLM, AutoTokenizer
-        import torch
+        transformers = _lazy_transformers()
+        AutoModelForCausalLM, AutoTokenizer = transformers.AutoModelForCausalLM, transformers.AutoTokenizer
         
         _local_tokenizer = AutoTokenizer.from_pretrained(model_path, local_files_only=True)
         print("Loading model... (this may take a few minutes)")
-        _local_model = AutoModelForCausalLM.from_pretrained(
-            model_path,
-            dtype=torch.bfloat16,
-            device_map="auto",
-            local_files_only=True
-        )
+        load_kwargs = dict(dtype=torch.bfloat16, device_map="auto", local_files_only=True)
+        quantization_config = _get_quantization_config()
+        if quantization_config is not None:
+            load_kwargs["quantization_config"] = quantization_config
+        try:
+            # Fused attention kernels; needs: pip install flash-attn --no-build-isolation
+            _local_model = AutoModelForCausalLM.from_pretrained(
+                model_path, attn_implementation="flash_attention_2", **load_kwargs
+            )
+        except (ImportError, ValueError) as e:
+            print(f"flash_attention_2 unavailable ({e}), using sdpa attention")
+            _local_model = AutoModelForCausalLM.from_pretrained(
+                model_path, attn_implementation="sdpa", **load_kwargs
+            )
+        
+        # Resolved once here instead of on every call_local_model()
+        _local_device = next(_local_model.parameters()).device
+        _eos_id = _local_tokenizer.eos_token_id
+        _has_chat_template = bool(getattr(_local_tokenizer, 'chat_template', None))
+        if _has_chat_template:
+            _prefix_ids, _prompt_seam, _suffix_ids = _tokenize_chat_wrapper()
         
         _model_loaded = True
         print("✅ Local model loaded successfully!")
+        
+        # Before compiling, so Inductor sees the quantized linears
+        if os.environ.get("MISTRAL_QUANT", "").strip().lower() == "fp8":
+            _quantize_fp8()
+        
+        # Optional: compile for faster decoding (one-time warmup cost at load)
+        if os.environ.get("MISTRAL_COMPILE") == "1":
+            _compile_local_model()
+        
+        # Optional: let concurrent requests share forward passes
+        if os.environ.get("MISTRAL_CONTINUOUS_BATCHING") == "1":
+            _start_continuous_batching()
+        
+        # Lighter alternative: coalesce concurrent prompts into one padded generate
+        max_batch_size = int(os.environ.get("MISTRAL_BATCH_SIZE", "1"))
+        if _cb_manager is None and max_batch_size > 1:
+            _batcher = _LocalBatcher(max_batch_size, float(os.environ.get("MISTRAL_BATCH_WAIT_MS", "10")))
+            print(f"✅ Request batching enabled (up to {max_batch_size} prompts per generate)")
+        
         return _local_model, _local_tokenizer
         
     except Exception as e:
         print(f"Error loading local model: {e}")
         return None, None
 
-def call_local_model(prompt: str, max_new_tokens: int = 4096, temperature: float = 0.0):
-    """Call the local Mistral model directly (no API needed)"""
-    global _local_model, _local_tokenizer
+def _get_quantization_config():
+    """
+    Build a bitsandbytes config from MISTRAL_QUANT (nf4 | int8 | fp8 | none).
+    
+    NF4 keeps bf16 compute but reads ~4x less weight memory per token, which is what
+    bounds decode speed. int8 (LLM.int8) saves memory but is usually slower for
+    single-request inference. Returns None for none/unset, for fp8 (applied after
+    loading by _quantize_fp8) or if bitsandbytes is missing.
+    """
+    quant = os.environ.get("MISTRAL_QUANT", "none").strip().lower()
+    if quant in ("", "none", "fp8"):
+        return None
+    
+    try:
+        import bitsandbytes  # noqa: F401 - only checking it is installed
+        BitsAndBytesConfig = _lazy_transformers().BitsAndBytesConfig
+    except ImportError as e:
+        print(f"MISTRAL_QUANT={quant} ignored, bitsandbytes not available: {e}")
+        return None
+    
+    if quant == "nf4":
+        print("Loading model with 4-bit NF4 quantization")
+        return BitsAndBytesConfig(
+            load_in_4bit=True,
+            bnb_4bit_quant_type="nf4",
+            bnb_4bit_compute_dtype=torch.bfloat16,
+            bnb_4bit_use_double_quant=True,
+        )
+    if quant == "int8":
+        print("Loading model with 8-bit quantization")
+        return BitsAndBytesConfig(load_in_8bit=True)
+    
+    print(f"Unknown MISTRAL_QUANT value '{quant}', loading without quantization")
+    return None
+
+def _quantize_fp8():
+    """
+    Quantize the loaded model's linear layers to FP8 with torchao (MISTRAL_QUANT=fp8).
+    
+    Only on GPUs with FP8 tensor cores (Ada / Hopper, compute capability 8.9+);
+    elsewhere the model stays bf16. Pair with MISTRAL_COMPILE=1 - FP8 only pays
+    off once Inductor fuses the dequantize into the matmul.
+    """
+    if not torch.cuda.is_available() or torch.cuda.get_device_capability() < (8, 9):
+        print("MISTRAL_QUANT=fp8 needs an Ada/Hopper GPU, keeping bf16 weights")
+        return
+    
+    try:
+        from torchao.quantization import quantize_
+        try:
+            from torchao.quantization import Float8DynamicActivationFloat8WeightConfig
+            config = Float8DynamicActivationFloat8WeightConfig()
+        except ImportError:
+            # Older torchao releases
+            from torchao.quantization import float8_dynamic_activation_float8_weight
+            config = float8_dynamic_activation_float8_weight()
+        quantize_(_local_model, config)
+        print("✅ Quantized linear layers to FP8")
+    except Exception as e:
+        print(f"FP8 quantization failed, keeping bf16 weights: {e}")
+
+def _compile_local_model():
+    """Compile each decoder layer with torch.compile and warm it up; stay eager on failure"""
+    global _use_static_cache
+    
+    # Regional compile: the decoder layers share one structure, so Dynamo traces a
+    # single block and reuses it instead of tracing the whole model. generate() itself
+    # stays eager so KV-cache bookkeeping and sampling don't trigger recompiles.
+    layers = _local_model.model.layers
+    eager_layers = list(layers)
+    try:
+        print(f"Compiling {len(layers)} decoder layers with torch.compile (first run takes a minute or more)...")
+        # Verbose during warmup so graph breaks show up in the log
+        torch._dynamo.config.verbose = True
+        for i, layer in enumerate(eager_layers):
+            layers[i] = torch.compile(layer, mode="reduce-overhead", fullgraph=True)
+        
+        warmup_inputs = _local_tokenizer("warmup", return_tensors="pt").to(_local_device)
+        with torch.no_grad():
+            _local_model.generate(**warmup_inputs, max_new_tokens=4, do_sample=False,
+                                  pad_token_id=_eos_id, cache_implementation="static")
+        _use_static_cache = True
+        print("✅ torch.compile warmup finished")
+    except Exception as e:
+        for i, layer in enumerate(eager_layers):
+            layers[i] = layer
+        print(f"torch.compile failed, using eager model: {e}")
+    finally:
+        torch._dynamo.config.verbose = False
+
+def _start_continuous_batching():
+    """Start transformers' continuous-batching manager for the local model; keep per-request generate on failure"""
+    global _cb_manager
+    try:
+        generation_config = _lazy_transformers().GenerationConfig(
+            max_new_tokens=4096,
+            do_sample=False,
+            eos_token_id=_eos_id,
+            pad_token_id=_eos_id,
+        )
+        manager = _local_model.init_continuous_batching(generation_config=generation_config)
+        manager.start()
+        _cb_manager = manager
+        print("✅ Continuous batching enabled")
+    except Exception as e:
+        # Needs a recent transformers and a paged-capable attention backend (flash_attention_2 / sdpa_paged)
+        print(f"Continuous batching unavailable, using per-request generate: {e}")
+
+def _generate_continuous_batching(input_ids, max_new_tokens):
+    """Submit one prompt to the continuous-batching manager and wait for its tokens"""
+    request_id = _cb_manager.add_request(input_ids, max_new_tokens=max_new_tokens)
+    for result in _cb_manager.request_id_iter(request_id):
+        status = result.status.name
+        if status == "FAILED":
+            raise RuntimeError(f"Continuous batching request failed: {result.error}")
+        if status == "FINISHED":
+            return result.generated_tokens
+    raise RuntimeError("Continuous batching manager stopped before the request finished")
+
+def _predict_batch(tokenizer, formatted_prompts, max_new_tokens):
+    """
+    Run several formatted prompts through one left-padded generate; returns decoded texts in order.
+    tokenizer must pad on the left (the batcher's own copy of the model's tokenizer).
+    """
+    # A rendered chat template already starts with BOS; don't let the tokenizer add a second
+    inputs = tokenizer(formatted_prompts, return_tensors="pt", padding=True,
+                       add_special_tokens=not _has_chat_template).to(_local_device)
+    with torch.no_grad():
+        outputs = _local_model.generate(
+            **inputs,
+            max_new_tokens=max(max_new_tokens),
+            do_sample=False,
+            pad_token_id=_eos_id
+        )
+    
+    # Left padding gives every row the same prompt length
+    prompt_len = inputs['input_ids'].shape[1]
+    return [
+        _local_tokenizer.decode(output[prompt_len:prompt_len + limit], skip_special_tokens=True).strip()
+        for output, limit in zip(outputs, max_new_tokens)
+    ]
+
+class _LocalBatcher:
+    """
+    Coalesces concurrent call_local_model() prompts into a single generate.
+    
+    A worker thread takes the first queued prompt, waits up to wait_ms for more
+    (up to max_batch_size), runs them together and resolves each caller's Future.
+    """
+    
+    def __init__(self, max_batch_size, wait_ms):
+        self.max_batch_size = max_batch_size
+        self.wait_seconds = wait_ms / 1000.0
+        self._queue = queue.Queue()
+        
+        # Batched prompts must be padded on the left so generation continues each prompt.
+        # Set on a copy: the shared tokenizer serves the single-prompt and streaming paths.
+        self._tokenizer = copy.deepcopy(_local_tokenizer)
+        self._tokenizer.padding_side = "left"
+        if self._tokenizer.pad_token is None:
+            self._tokenizer.pad_token = self._tokenizer.eos_token
+        
+        threading.Thread(target=self._worker, name="local-model-batcher", daemon=True).start()
+    
+    def submit(self, formatted_prompt, max_new_tokens):
+        """Queue one prompt and block until its text is ready"""
+        future = Future()
+        self._queue.put((formatted_prompt, max_new_tokens, future))
+        return future.result()
+    
+    def _worker(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.wait_seconds
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            try:
+                texts = _predict_batch(self._tokenizer, [item[0] for item in batch], [item[1] for item in batch])
+                for (_, _, future), text in zip(batch, texts):
+                    future.set_result(text)
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+
+def _format_local_prompt(prompt: str):
+    """Wrap a prompt in the model's chat template (or the plain Mistral [INST] format)"""
+    if _has_chat_template:
+        messages = [{"role": "user", "content": prompt}]
+        return _local_tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+    return f"[INST] {prompt} [/INST]"
+
+def _chat_template_ids(prompt: str):
+    """Token ids of the prompt rendered and tokenized by the chat template itself"""
+    messages = [{"role": "user", "content": prompt}]
+    ids = _local_tokenizer.apply_chat_template(messages, tokenize=True, add_generation_prompt=True)
+    # Newer transformers return a BatchEncoding rather than a plain list
+    if not isinstance(ids, list):
+        ids = ids["input_ids"]
+    return list(ids)
+
+def _tokenize_chat_wrapper():
+    """
+    Token ids of the chat template text around the user message, as (prefix, seam, suffix).
     
+    The template is fixed apart from the message, so rendering it once with a
+    placeholder lets each call skip the Jinja render and only tokenize the prompt.
+    The prefix keeps the template's single BOS. A trailing space on the prefix
+    ("[INST] ") is returned as the seam and tokenized with the prompt instead, since
+    SentencePiece folds it into the prompt's first token ("▁Extract", not "▁" + "Extract").
+    Returns (None, "", None) if the rendered template can't be split on the placeholder,
+    or if the spliced ids don't match apply_chat_template(tokenize=True) for the samples.
+    """
+    placeholder = "\0PLACEHOLDER\0"
+    messages = [{"role": "user", "content": placeholder}]
+    rendered = _local_tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+    parts = rendered.split(placeholder)
+    if len(parts) != 2:
+        return None, "", None
+    prefix, suffix = parts
+    seam = ""
+    if prefix.endswith(" "):
+        prefix, seam = prefix[:-1], " "
+    prefix_ids = _local_tokenizer.encode(prefix, add_special_tokens=False)
+    suffix_ids = _local_tokenizer.encode(suffix, add_special_tokens=False)
+    
+    for sample in ("Extract the product details as JSON.", " {\"price\": \"₹874\"}\n", "\nPrice: ₹874 only", ""):
+        wrapped = prefix_ids + _local_tokenizer.encode(seam + sample, add_special_tokens=False) + suffix_ids
+        if wrapped != _chat_template_ids(sample):
+            print("Chat template tokens differ when split, rendering the template per call")
+            return None, "", None
+    return prefix_ids, seam, suffix_ids
+
+def _encode_local_prompt(prompt: str):
+    """Token ids for a prompt wrapped in the chat template"""
+    if _prefix_ids is not None:
+        return _prefix_ids + _local_tokenizer.encode(_prompt_seam + prompt, add_special_tokens=False) + _suffix_ids
+    if _has_chat_template:
+        return _chat_template_ids(prompt)
+    return _local_tokenizer.encode(_format_local_prompt(prompt))
+
+def _ensure_local_model():
     if not _model_loaded:
         model, tokenizer = load_local_model()
         if model is None or tokenizer is None:
             raise ValueError("Local model could not be loaded")
+
+class _JsonObjectStop:
+    """
+    Stopping criterion that ends generation once a JSON answer closes.
+    
+    Only armed when the output starts (after whitespace) with "{" or "[": it then tracks
+    bracket depth over the generated tokens, ignoring brackets inside JSON strings, so a
+    short extraction answer doesn't keep decoding up to max_new_tokens. Output that
+    starts with anything else (prose, a code fence) is left to run to EOS.
+    """
+    
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escaped = False
+        self.done = False
+    
+    def __call__(self, input_ids, scores, **kwargs):
+        if self.done is False:
+            for ch in self.tokenizer.decode(input_ids[0, -1:]):
+                if not self.started:
+                    if ch in "{[":
+                        self.depth = 1
+                        self.started = True
+                    elif not ch.isspace():
+                        self.done = None  # not a JSON answer - never stop early
+                        break
+                elif self.in_string:
+                    if self.escaped:
+                        self.escaped = False
+                    elif ch == "\\":
+                        self.escaped = True
+                    elif ch == '"':
+                        self.in_string = False
+                elif ch == '"':
+                    self.in_string = True
+                elif ch in "{[":
+                    self.depth += 1
+                elif ch in "}]":
+                    self.depth -= 1
+                    if self.depth == 0:
+                        self.done = True
+                        break
+        return torch.full((input_ids.shape[0],), self.done is True, dtype=torch.bool, device=input_ids.device)
+
+def call_local_model_stream(prompt: str, max_new_tokens: int = 4096, temperature: float = 0.0, stop_at_json: bool = False):
+    """
+    Stream text from the local Mistral model as it is generated.
+    
+    generate() runs on a background thread and decoded pieces are yielded as soon
+    as they are ready. With stop_at_json, generation ends once the first JSON
+    object in the output is closed.
+    """
+    _ensure_local_model()
+    transformers = _lazy_transformers()
+    StoppingCriteriaList, TextIteratorStreamer = transformers.StoppingCriteriaList, transformers.TextIteratorStreamer
+    
+    input_ids = torch.tensor([_encode_local_prompt(prompt)], device=_local_device)
+    inputs = {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
+    streamer = TextIteratorStreamer(_local_tokenizer, skip_prompt=True, skip_special_tokens=True)
+    
+    gen_kwargs = dict(
+        **inputs,
+        max_new_tokens=max_new_tokens,
+        temperature=temperature,
+        do_sample=(temperature > 0),
+        pad_token_id=_eos_id,
+        streamer=streamer
+    )
+    if _use_static_cache:
+        # Pre-allocated KV cache (sized prompt + max_new_tokens) keeps per-step tensor
+        # shapes fixed, so the compiled layers don't recompile during decoding
+        gen_kwargs["cache_implementation"] = "static"
+    if stop_at_json:
+        gen_kwargs["stopping_criteria"] = StoppingCriteriaList([_JsonObjectStop(_local_tokenizer)])
+    
+    errors = []
+    
+    def _generate():
+        try:
+            _local_model.generate(**gen_kwargs)
+        except Exception as e:
+            errors.append(e)
+            streamer.end()  # unblock the consumer below
+    
+    thread = threading.Thread(target=_generate, name="local-model-generate", daemon=True)
+    thread.start()
+    yield from streamer
+    thread.join()
+    if errors:
+        raise errors[0]
+
+def call_local_model(prompt: str, max_new_tokens: int = 4096, temperature: float = 0.0, stop_at_json: bool = False):
+    """
+    Call the local Mistral model directly (no API needed).
+    
+    stop_at_json only applies to prompts generated on their own: greedy requests that
+    join the continuous batch or the padded batcher share one generate with other
+    prompts and decode until EOS / max_new_tokens.
+    """
+    _ensure_local_model()
     
     try:
-        import torch
-        
-        # Format prompt using chat template if available
-        if hasattr(_local_tokenizer, 'apply_chat_template') and _local_tokenizer.chat_template:
-            messages = [{"role": "user", "content": prompt}]
-            formatted_prompt = _local_tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-        else:
-            formatted_prompt = f"[INST] {prompt} [/INST]"
-        
-        inputs = _local_tokenizer(formatted_prompt, return_tensors="pt")
-        device = next(_local_model.parameters()).device
-        inputs = {k: v.to(device) for k, v in inputs.items()}
+        # Greedy requests join the shared batch; the manager's generation config is greedy
+        if _cb_manager is not None and temperature == 0:
+            input_ids = _encode_local_prompt(prompt)
+            generated_ids = _generate_continuous_batching(input_ids, max_new_tokens)
+            return _local_tokenizer.decode(generated_ids, skip_special_tokens=True).strip()
         
-        with torch.no_grad():
-            outputs = _local_model.generate(
-                **inputs,
-                max_new_tokens=max_new_tokens,
-                temperature=temperature,
-                do_sample=(temperature > 0),
-                pad_token_id=_local_tokenizer.eos_token_id
-            )
+        if _batcher is not None and temperature == 0:
+            return _batcher.submit(_format_local_prompt(prompt), max_new_tokens)
         
-        generated_text = _local_tokenizer.decode(outputs[0][inputs['input_ids'].shape[1]:], skip_special_tokens=True)
-        return generated_text.strip()
+        return "".join(call_local_model_stream(prompt, max_new_tokens, temperature, stop_at_json)).strip()
         
     except Exception as e:
         raise Exception(f"Error calling local model: {e}")
@@ -97,6 +560,78 @@ def get_mistral_api_key():
     """Get MISTRAL_API_KEY from environment (reads dynamically, falls back to HF_TOKEN)"""
     return os.environ.get("MISTRAL_API_KEY") or os.environ.get("HF_TOKEN")
 
+def _retry_delay(attempt: int, retry_after=None):
+    """
+    Seconds to wait before the next attempt.
+    
+    Uses the server's Retry-After when it sent one, otherwise jittered exponential
+    backoff. The jitter keeps concurrent workers sharing one API key from all
+    retrying in the same second and hitting the rate limit again.
+    """
+    try:
+        seconds = float(retry_after) if retry_after is not None else None
+    except ValueError:
+        seconds = None  # HTTP-date form - just back off
+    if seconds is not None:
+        return seconds + random.uniform(0, 2 ** attempt)
+    return min(60, random.uniform(0.5, 1.5) * 2 ** attempt)
+
+def _retry_post(url: str, headers: dict, body: bytes, max_retries: int, timeout, default_retry_after=None):
+    """
+    POST to an inference API, retrying rate limits (429), server errors (5xx),
+    timeouts and connection errors.
+    
+    Args:
+        url: Endpoint URL
+        headers: Per-call headers (Authorization, Content-Encoding)
+        body: Serialized request body
+        max_retries: Maximum number of attempts
+        timeout: requests timeout, (connect, read)
+        default_retry_after: Wait used for a 429 without a Retry-After header
+    
+    Returns:
+        requests.Response: The successful response
+    
+    Raises:
+        requests.exceptions.HTTPError for the final error status (other 4xx are not retried),
+        requests.exceptions.RequestException if the last attempt failed to get a response
+    """
+    for attempt in range(max_retries):
+        is_last = attempt == max_retries - 1
+        try:
+            r = _session.post(url, headers=headers, data=body, timeout=timeout)
+        except requests.exceptions.RequestException as e:
+            if is_last:
+                raise
+            wait_time = _retry_delay(attempt)
+            print(f"Request failed ({type(e).__name__}), retrying in {wait_time:.1f} seconds... (attempt {attempt + 1}/{max_retries})")
+            time.sleep(wait_time)
+            continue
+        
+        if (r.status_code == 429 or r.status_code >= 500) and not is_last:
+            retry_after = r.headers.get('Retry-After')
+            if retry_after is None and r.status_code == 429:
+                retry_after = default_retry_after
+            wait_time = _retry_delay(attempt, retry_after)
+            print(f"⚠️  {r.status_code} from API. Waiting {wait_time:.1f} seconds before retry... (attempt {attempt + 1}/{max_retries})")
+            time.sleep(wait_time)
+            continue
+        
+        r.raise_for_status()
+        return r
+
+@functools.lru_cache(maxsize=4)
+def _classify_key(key):
+    """'hf' for Hugging Face tokens (hf_...), 'mistral' for any other key, 'unknown' if unset"""
+    if not key:
+        return "unknown"
+    return "hf" if key.startswith("hf_") else "mistral"
+
+@functools.lru_cache(maxsize=4)
+def _bearer_header(key):
+    """Authorization header for a key - cached, so copy before adding headers"""
+    return {"Authorization": f"Bearer {key}"}
+
 def call_mistral_api(prompt: str, max_retries: int = 3):
     """
     Call Mistral API directly.
@@ -108,85 +643,45 @@ def call_mistral_api(prompt: str, max_retries: int = 3):
     Returns:
         dict: Response from the API
     """
-    import time
     mistral_key = get_mistral_api_key()
     if not mistral_key:
         raise ValueError("MISTRAL_API_KEY or HF_TOKEN environment variable is not set.")
     
     url = "https://api.mistral.ai/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {mistral_key}",
-        "Content-Type": "application/json"
-    }
+    headers = dict(_bearer_header(mistral_key))
     payload = {
         "model": "mistral-medium",  # or "mistral-small", "mistral-large"
         "messages": [{"role": "user", "content": prompt}],
         "temperature": 0.0,
         "max_tokens": 4096  # Increased for long custom fields (offers, descriptions, etc.)
     }
+    body = _encode_body(payload, headers)
     
-    for attempt in range(max_retries):
-        try:
-            # Use longer timeout for large prompts (30s connect, 180s read)
-            # Large prompts (18k+ chars) may take 2-3 minutes to process
-            timeout_duration = (30, 180)  # (connect timeout, read timeout)
-            r = requests.post(url, headers=headers, json=payload, timeout=timeout_duration)
-            
-            # Check for rate limit (429)
-            if r.status_code == 429:
-                retry_after = int(r.headers.get('Retry-After', 60))  # Default 60 seconds if header not present
-                if attempt < max_retries - 1:
-                    wait_time = max(retry_after, 60)  # Wait at least 60 seconds for rate limit
-                    print(f"⚠️  Rate limit exceeded (429). Waiting {wait_time} seconds before retry... (attempt {attempt + 1}/{max_retries})")
-                    print(f"💡 Tip: Mistral API has rate limits. Consider upgrading your plan or waiting longer.")
-                    time.sleep(wait_time)
-                    continue
-                else:
-                    # Create proper HTTPError with response
-                    from requests.exceptions import HTTPError
-                    error_msg = (
-                        f"429 Too Many Requests: Rate limit exceeded. Please wait {retry_after} seconds before trying again. "
-                        f"Or upgrade your Mistral API plan for higher limits."
-                    )
-                    http_error = HTTPError(error_msg)
-                    http_error.response = r
-                    raise http_error
-            
-            r.raise_for_status()
-            return r.json()
-        except requests.exceptions.HTTPError as e:
-            # Rate limit already handled above, but check here too for safety
-            if hasattr(e, 'response') and e.response and e.response.status_code == 429:
-                raise  # Re-raise rate limit errors (should already be handled above)
-            if attempt < max_retries - 1:
-                wait_time = 2 ** attempt
-                print(f"Request failed, retrying in {wait_time} seconds... (attempt {attempt + 1}/{max_retries})")
-                time.sleep(wait_time)
-            else:
-                raise
-        except requests.exceptions.Timeout as e:
-            # Handle timeout specifically - large prompts may need more time
-            if attempt < max_retries - 1:
-                wait_time = 2 ** attempt
-                print(f"⏱️  Request timeout - API is taking too long to respond (large prompt: {len(prompt)} chars)")
-                print(f"   Retrying in {wait_time} seconds... (attempt {attempt + 1}/{max_retries})")
-                print(f"   💡 Tip: This can happen with large prompts. Consider using shorter text or waiting.")
-                time.sleep(wait_time)
-            else:
-                raise requests.exceptions.Timeout(
-                    f"Request timed out after 180 seconds. The prompt is very large ({len(prompt)} characters).\n"
-                    f"💡 Solutions:\n"
-                    f"   1. Wait a moment and try again (API may be experiencing high load)\n"
-                    f"   2. Consider using a smaller/faster model (e.g., mistral-small instead of mistral-medium)\n"
-                    f"   3. Reduce the input text size if possible"
-                ) from e
-        except requests.exceptions.RequestException as e:
-            if attempt < max_retries - 1:
-                wait_time = 2 ** attempt
-                print(f"Request failed, retrying in {wait_time} seconds... (attempt {attempt + 1}/{max_retries})")
-                time.sleep(wait_time)
-            else:
-                raise
+    try:
+        # Use longer timeout for large prompts (30s connect, 180s read)
+        # Large prompts (18k+ chars) may take 2-3 minutes to process
+        # Mistral rate limits usually need about a minute when no Retry-After is sent
+        r = _retry_post(url, headers, body, max_retries, timeout=(30, 180), default_retry_after=60)
+    except requests.exceptions.HTTPError as e:
+        if e.response is not None and e.response.status_code == 429:
+            retry_after = e.response.headers.get('Retry-After', 60)
+            error_msg = (
+                f"429 Too Many Requests: Rate limit exceeded. Please wait {retry_after} seconds before trying again. "
+                f"Or upgrade your Mistral API plan for higher limits."
+            )
+            http_error = requests.exceptions.HTTPError(error_msg)
+            http_error.response = e.response
+            raise http_error from e
+        raise
+    except requests.exceptions.Timeout as e:
+        raise requests.exceptions.Timeout(
+            f"Request timed out after 180 seconds. The prompt is very large ({len(prompt)} characters).\n"
+            f"💡 Solutions:\n"
+            f"   1. Wait a moment and try again (API may be experiencing high load)\n"
+            f"   2. Consider using a smaller/faster model (e.g., mistral-small instead of mistral-medium)\n"
+            f"   3. Reduce the input text size if possible"
+        ) from e
+    return _loads(r.content)
 
 def call_hf_inference(prompt: str, model: str = MODEL, max_retries: int = 3, use_mistral_api=False):
     """
@@ -200,15 +695,19 @@ def call_hf_inference(prompt: str, model: str = MODEL, max_retries: int = 3, use
         use_mistral_api: If True, use Mistral API directly instead of HF
     
     Returns:
-        dict: Response from the model/API
+        tuple: (response, extractor) - call extractor(response) to get the generated text
     """
+    # Optional: start every configured backend at once and take the first success
+    if os.environ.get("MODEL_RACE_BACKENDS") == "1":
+        return asyncio.run(call_hf_inference_async(prompt, model, max_retries, use_mistral_api))
+    
     # FIRST: Try local model if available
     model_path = get_local_model_path()
     if model_path:
         try:
             print("Using local model (trying first)...")
-            generated_text = call_local_model(prompt, max_new_tokens=4096, temperature=0.0)
-            return {"generated_text": generated_text}
+            generated_text = call_local_model(prompt, max_new_tokens=4096, temperature=0.0, stop_at_json=True)
+            return {"generated_text": generated_text}, _extract_local
         except Exception as e:
             print(f"Local model failed: {e}")
             print("Falling back to API...")
@@ -219,14 +718,14 @@ def call_hf_inference(prompt: str, model: str = MODEL, max_retries: int = 3, use
     hf_token = get_hf_token()
     
     # Try Mistral API first if key format suggests it or explicitly requested
-    if use_mistral_api or (mistral_key and not mistral_key.startswith("hf_")):
+    if use_mistral_api or _classify_key(mistral_key) == "mistral":
         try:
-            return call_mistral_api(prompt, max_retries)
+            return call_mistral_api(prompt, max_retries), _extract_mistral
         except requests.exceptions.HTTPError as e:
             # Check if it's a rate limit error (429) - don't fallback to HF if we don't have valid HF token
-            if e.response and e.response.status_code == 429:
+            if e.response is not None and e.response.status_code == 429:
                 # Only try HF if we have a valid HF token
-                if hf_token and hf_token.startswith("hf_"):
+                if _classify_key(hf_token) == "hf":
                     print(f"Mistral API rate limit exceeded. Falling back to HuggingFace API...")
                 else:
                     # No valid HF token, re-raise the rate limit error with helpful message
@@ -240,7 +739,7 @@ def call_hf_inference(prompt: str, model: str = MODEL, max_retries: int = 3, use
                     http_error = requests.exceptions.HTTPError(error_msg)
                     http_error.response = e.response
                     raise http_error from e
-            elif e.response and e.response.status_code == 401:
+            elif e.response is not None and e.response.status_code == 401:
                 # Authentication error - don't try HF fallback
                 error_msg = (
                     f"401 Unauthorized: Invalid Mistral API key.\n"
@@ -251,7 +750,7 @@ def call_hf_inference(prompt: str, model: str = MODEL, max_retries: int = 3, use
                 raise http_error from e
             else:
                 # Other errors - try HF if we have valid token
-                if hf_token and hf_token.startswith("hf_"):
+                if _classify_key(hf_token) == "hf":
                     print(f"Mistral API call failed: {e}, trying HF API...")
                 else:
                     raise  # Re-raise if no valid HF token
@@ -267,32 +766,103 @@ def call_hf_inference(prompt: str, model: str = MODEL, max_retries: int = 3, use
         )
     
     # Try HF API even if token doesn't start with "hf_" (some tokens might have different format)
-    if not hf_token.startswith("hf_"):
+    if _classify_key(hf_token) != "hf":
         print(f"⚠ Note: Token doesn't start with 'hf_' - trying HuggingFace API anyway...")
     
+    return call_hf_api(prompt, model, max_retries), _extract_hf
+
+async def call_hf_inference_async(prompt: str, model: str = MODEL, max_retries: int = 3, use_mistral_api=False):
+    """
+    Run every available backend (local model, Mistral API, HF API) concurrently.
+    
+    Returns the first successful (response, extractor) pair and cancels the rest, so a slow or
+    rate-limited backend no longer delays the next one. Raises the last error
+    only if all backends fail.
+    """
+    mistral_key = get_mistral_api_key()
+    hf_token = get_hf_token()
+    
+    backends = {}
+    if get_local_model_path():
+        backends["local"] = lambda: ({"generated_text": call_local_model(prompt, max_new_tokens=4096, temperature=0.0, stop_at_json=True)}, _extract_local)
+    if use_mistral_api or _classify_key(mistral_key) == "mistral":
+        backends["Mistral API"] = lambda: (call_mistral_api(prompt, max_retries), _extract_mistral)
+    if hf_token:
+        backends["HF API"] = lambda: (call_hf_api(prompt, model, max_retries), _extract_hf)
+    if not backends:
+        raise ValueError("No model backend available: no local model and no MISTRAL_API_KEY / HF_TOKEN set.")
+    
+    loop = asyncio.get_running_loop()
+    tasks = {loop.run_in_executor(_backend_executor, fn): name for name, fn in backends.items()}
+    print(f"Racing backends: {', '.join(tasks.values())}")
+    
+    pending = set(tasks)
+    last_error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    print(f"Using response from {tasks[task]}")
+                    return task.result()
+                last_error = task.exception()
+                print(f"{tasks[task]} failed: {last_error}")
+        raise last_error
+    finally:
+        for task in pending:
+            task.cancel()
+
+def call_hf_api(prompt: str, model: str = MODEL, max_retries: int = 3):
+    """
+    Call the Hugging Face Inference API with retry logic.
+    
+    Args:
+        prompt: The prompt to send to the model
+        model: Model ID to use
+        max_retries: Maximum number of retry attempts
+    
+    Returns:
+        list: Response from the API
+    """
+    hf_token = get_hf_token()
     url = f"https://api-inference.huggingface.co/models/{model}"
-    headers = {"Authorization": f"Bearer {hf_token}", "Content-Type": "application/json"}
+    headers = dict(_bearer_header(hf_token))
     payload = {"inputs": prompt, "parameters": {"max_new_tokens": 4096, "temperature": 0.0}}  # Increased for long custom fields
+    body = _encode_body(payload, headers)
     
-    for attempt in range(max_retries):
-        try:
-            # Increased timeout for large prompts
-            r = requests.post(url, headers=headers, json=payload, timeout=(30, 120))
-            r.raise_for_status()
-            return r.json()
-        except requests.exceptions.RequestException as e:
-            if attempt < max_retries - 1:
-                wait_time = 2 ** attempt  # exponential backoff
-                print(f"Request failed, retrying in {wait_time} seconds... (attempt {attempt + 1}/{max_retries})")
-                import time
-                time.sleep(wait_time)
-            else:
-                raise
+    # Increased timeout for large prompts
+    r = _retry_post(url, headers, body, max_retries, timeout=(30, 120))
+    return _loads(r.content)
+
+def _extract_local(resp):
+    """Text from a local model response ({"generated_text": ...})"""
+    return resp["generated_text"]
+
+def _extract_mistral(resp):
+    """Text from a Mistral API chat completion"""
+    try:
+        return resp["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError):
+        return str(resp)
+
+def _extract_hf(resp):
+    """Text from a Hugging Face Inference API response (normally [{"generated_text": ...}])"""
+    try:
+        return resp[0]["generated_text"]
+    except (KeyError, IndexError, TypeError):
+        pass
+    # Uncommon shapes: a bare dict, a "text" key, or a list of strings
+    item = resp[0] if isinstance(resp, list) and resp else resp
+    if isinstance(item, dict):
+        return item.get("generated_text") or item.get("text") or str(item)
+    return str(item)
 
 def extract_json_from_response(resp, is_mistral=False, is_local=False):
     """
     Extract JSON from API response (Hugging Face, Mistral, or local model).
     
+    Kept for callers that don't use the extractor returned by call_hf_inference.
+    
     Args:
         resp: Response from API or local model
         is_mistral: Whether this is a Mistral API response
@@ -302,32 +872,10 @@ def extract_json_from_response(resp, is_mistral=False, is_local=False):
         str: Extracted text from the response
     """
     if is_local:
-        if isinstance(resp, dict):
-            return resp.get("generated_text", str(resp))
-        return str(resp)
-    elif is_mistral:
-        # Mistral API response format
-        if isinstance(resp, dict):
-            choices = resp.get("choices", [])
-            if choices and len(choices) > 0:
-                generated = choices[0].get("message", {}).get("content", "")
-                return generated
-        return str(resp)
-    else:
-        # Hugging Face API response format
-        if isinstance(resp, list):
-            if len(resp) > 0:
-                if isinstance(resp[0], dict):
-                    generated = resp[0].get("generated_text") or resp[0].get("text") or str(resp[0])
-                else:
-                    generated = str(resp[0])
-            else:
-                generated = str(resp)
-        elif isinstance(resp, dict):
-            generated = resp.get("generated_text") or resp.get("text") or str(resp)
-        else:
-            generated = str(resp)
-        return generated
+        return resp.get("generated_text", str(resp)) if isinstance(resp, dict) else str(resp)
+    if is_mistral:
+        return _extract_mistral(resp)
+    return _extract_hf(resp)
 
 if __name__ == "__main__":
     # Example prompt
@@ -349,8 +897,8 @@ Output (exact JSON):
 """
     
     try:
-        resp = call_hf_inference(prompt)
-        generated = extract_json_from_response(resp)
+        resp, extract = call_hf_inference(prompt)
+        generated = extract(resp)
         print("Response:", generated)
     except Exception as e:
         print(f"Error: {e}")
@@ -1,179 +1,919 @@
-from playwright.sync_api import sync_playwright
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError, sync_playwright
 from PIL import Image
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+import atexit
+import base64
+import functools
+import hashlib
 import io
+import itertools
+import json
+import numpy as np
+import os
+import pytesseract
+import re
+import shutil
+import threading
 import time
 
 
+class BrowserPool:
+    """
+    Long-lived browsers shared by all captures (captures only open/close contexts).
+    
+    Playwright's sync API is bound to the thread that started it, so each thread gets
+    its own Playwright instance and browsers, keyed by engine + launch options.
+    A semaphore caps how many captures hold a browser at once (bounds RAM), and a
+    browser is relaunched after max_pages_per_browser captures or max_age_seconds,
+    since long-running Chromium processes keep growing.
+    """
+    
+    def __init__(self, size: int = 4, max_pages_per_browser: int = 50, max_age_seconds: int = 300):
+        self.size = size
+        self.max_pages_per_browser = max_pages_per_browser
+        self.max_age_seconds = max_age_seconds
+        self._slots = threading.BoundedSemaphore(size)
+        self._local = threading.local()
+        self._states = []  # every thread's state, for close_all()
+        self._lock = threading.Lock()
+    
+    def slot(self):
+        """Context manager holding one of the pool's capture slots"""
+        return self._slots
+    
+    def get(self, engine: str = "chromium", headless: bool = True, args=None):
+        """Return this thread's browser for the engine/options, launching or recycling it as needed"""
+        state = getattr(self._local, "state", None)
+        if state is None:
+            state = {"playwright": sync_playwright().start(), "browsers": {}}
+            self._local.state = state
+            with self._lock:
+                self._states.append(state)
+        
+        key = (engine, headless, tuple(args or ()))
+        entry = state["browsers"].get(key)
+        if entry is not None and (
+            not entry["browser"].is_connected()
+            or entry["pages"] >= self.max_pages_per_browser
+            or time.monotonic() - entry["launched_at"] > self.max_age_seconds
+        ):
+            try:
+                entry["browser"].close()
+            except Exception:
+                pass
+            entry = None
+        if entry is None:
+            launcher = getattr(state["playwright"], engine)
+            entry = {
+                "browser": launcher.launch(headless=headless, args=list(args or ())),
+                "pages": 0,
+                "launched_at": time.monotonic(),
+            }
+            state["browsers"][key] = entry
+        
+        entry["pages"] += 1
+        return entry["browser"]
+    
+    def get_context(self, browser, name: str, factory, max_pages: int = 20):
+        """
+        Long-lived context `name` on this thread's browser, so repeat captures keep its HTTP
+        cache and cookies and only open a page. Built by factory(browser); replaced after
+        max_pages pages (contexts leak memory too) or when the browser was recycled.
+        Returns (context, created) - created is True for a brand-new context.
+        """
+        contexts = self._local.state.setdefault("contexts", {})
+        entry = contexts.get(name)
+        if entry is not None and (entry["pages"] >= max_pages or entry["context"].browser is not browser):
+            try:
+                entry["context"].close()
+            except Exception:
+                pass
+            entry = None
+        created = entry is None
+        if created:
+            entry = {"context": factory(browser), "pages": 0}
+            contexts[name] = entry
+        entry["pages"] += 1
+        return entry["context"], created
+    
+    def close_all(self):
+        """Best-effort shutdown; Playwright objects owned by other threads may refuse, the driver exits with us anyway"""
+        with self._lock:
+            states = list(self._states)
+            self._states.clear()
+        for state in states:
+            for entry in state["browsers"].values():
+                try:
+                    entry["browser"].close()
+                except Exception:
+                    pass
+            try:
+                state["playwright"].stop()
+            except Exception:
+                pass
+
+
+_browser_pool = BrowserPool(size=int(os.environ.get("BROWSER_POOL_SIZE", "4")))
+atexit.register(_browser_pool.close_all)
+
+
+# One launch configuration for every Chromium strategy: they differ only in their context
+# (user agent, viewport, stealth script), so the pool hands them the same running browser
+# and switching strategy costs a new context (~50 ms) instead of a launch. No zygote, no
+# GPU/WebGL/accelerated canvas, no background services, and no --window-size (headless
+# only needs the context viewport) - all of it memory a screenshot doesn't need.
+# Renderers are shared per site and capped at two, so a batch of product pages from the
+# same shop doesn't fan out into one renderer process per page.
+CHROMIUM_ARGS = [
+    '--disable-blink-features=AutomationControlled',
+    '--no-sandbox',
+    '--disable-setuid-sandbox',
+    '--disable-dev-shm-usage',
+    '--no-zygote',
+    '--disable-gpu',
+    '--disable-software-rasterizer',
+    '--disable-accelerated-2d-canvas',
+    '--disable-webgl',
+    '--disable-mipmap-generation',
+    '--disable-partial-raster',
+    '--disable-features=IsolateOrigins,site-per-process',
+    '--disable-background-networking',
+    '--disable-sync',
+    '--disable-default-apps',
+    '--disable-extensions',
+    '--mute-audio',
+    '--no-first-run',
+    '--process-per-site',
+    '--renderer-process-limit=2',
+]
+# PW_SINGLE_PROCESS=1 runs the browser, renderer and network service in one process, for
+# hosts with very little RAM. Chromium doesn't support it officially: a renderer crash
+# takes the whole browser (and every capture on it) down, so it stays opt-in.
+if os.environ.get("PW_SINGLE_PROCESS") == "1":
+    CHROMIUM_ARGS.append('--single-process')
+
+
+def _get_browser(engine: str = "chromium", headless: bool = True, args=None):
+    """Browser from the shared pool for the calling thread"""
+    return _browser_pool.get(engine, headless, args)
+
+
+# Capture strategies for one URL run concurrently on this pool. Module-level so its
+# threads (and the browsers each of them keeps in _browser_pool) live across captures.
+# Captures run all their browser work on these threads (DOM fetches use _dom_executor).
+CAPTURE_STRATEGY_WORKERS = int(os.environ.get("CAPTURE_STRATEGY_WORKERS", "4"))
+_strategy_executor = ThreadPoolExecutor(
+    max_workers=CAPTURE_STRATEGY_WORKERS,
+    thread_name_prefix="capture-strategy",
+)
+
+# DOM fetches (scrape_dom via run_with_browser) get their own threads, and so their own
+# browsers: one capture races up to four strategies at once, which would otherwise hold
+# every strategy thread and queue the DOM fetch of the same extraction behind it. Each
+# extraction in flight (EXTRACT_CONCURRENCY in app.py) needs one, hence the default.
+DOM_FETCH_WORKERS = int(os.environ.get("DOM_FETCH_WORKERS", os.environ.get("EXTRACT_CONCURRENCY", "4")))
+_dom_executor = ThreadPoolExecutor(
+    max_workers=max(1, DOM_FETCH_WORKERS),
+    thread_name_prefix="dom-fetch",
+)
+
+
+def warm_up_browsers():
+    """
+    Start the Playwright driver and launch Chromium on every strategy thread now, so the
+    first captures don't pay for it. Returns immediately; the work runs on those threads.
+    """
+    # The barrier keeps each task on its thread until all have started, so every
+    # strategy thread (not just the first free one) gets one
+    barrier = threading.Barrier(CAPTURE_STRATEGY_WORKERS)
+    
+    def _warm():
+        try:
+            barrier.wait(timeout=30)
+        except threading.BrokenBarrierError:
+            pass  # Some threads were busy capturing - they start their own on first use
+        try:
+            _get_browser("chromium", headless=True, args=CHROMIUM_ARGS)
+        except Exception as e:
+            print(f"Browser warm-up failed: {e}")
+    
+    for _ in range(CAPTURE_STRATEGY_WORKERS):
+        _strategy_executor.submit(_warm)
+
+
+def run_with_browser(fn, engine: str = "chromium", headless: bool = True, args=CHROMIUM_ARGS):
+    """
+    Call fn(browser) with a pooled browser and return its result. Runs on a DOM fetch
+    thread (the pool's browsers belong to the thread that launched them), so it doesn't
+    wait for capture strategies; DOM_FETCH_WORKERS bounds how many run at once.
+    fn should only open and close contexts, never the browser itself.
+    """
+    return _dom_executor.submit(lambda: fn(_get_browser(engine, headless=headless, args=args))).result()
+
+
+# Requests aborted during capture: nothing here shows up in (or is needed for) the screenshot
+BLOCKED_RESOURCE_TYPES = {"font", "media", "websocket"}
+TRACKER_DOMAINS = (
+    "google-analytics", "googletagmanager", "doubleclick", "facebook.net",
+    "hotjar", "segment.io", "criteo",
+)
+
+
+def block_heavy_requests(context, block_images: bool = False):
+    """
+    Abort fonts, media, websockets and analytics/ad trackers for every page in the context.
+    With block_images, images are dropped too - for pages that are only read as text/DOM,
+    never for screenshots. Stylesheets and scripts always load (the shops are SPAs, and
+    CSS decides what innerText includes), from the on-disk asset cache when possible.
+    """
+    blocked_types = BLOCKED_RESOURCE_TYPES | {"image"} if block_images else BLOCKED_RESOURCE_TYPES
+    
+    def _handle(route):
+        request = route.request
+        if request.resource_type in blocked_types or any(d in request.url for d in TRACKER_DOMAINS):
+            route.abort()
+        elif ASSET_CACHE_MAX_BYTES > 0 and request.method == "GET" and request.resource_type in CACHED_ASSET_TYPES:
+            _route_through_asset_cache(route)
+        else:
+            route.continue_()
+    
+    context.route("**/*", _handle)
+
+
+# Stealth patches and request headers shared by every capture helper. Built once at
+# import and installed per context (context.add_init_script / extra_http_headers)
+# instead of being re-created and re-sent for every page.
+STEALTH_JS = """
+    Object.defineProperty(navigator, 'webdriver', {
+        get: () => undefined
+    });
+    
+    window.chrome = {
+        runtime: {},
+        loadTimes: function() {},
+        csi: function() {},
+        app: {}
+    };
+    
+    Object.defineProperty(navigator, 'plugins', {
+        get: () => [1, 2, 3, 4, 5]
+    });
+    
+    Object.defineProperty(navigator, 'languages', {
+        get: () => ['en-US', 'en']
+    });
+    
+    Object.defineProperty(navigator, 'connection', {
+        get: () => ({
+            effectiveType: '4g',
+            rtt: 50,
+            downlink: 10,
+            saveData: false
+        })
+    });
+    
+    const originalQuery = window.navigator.permissions.query;
+    window.navigator.permissions.query = (parameters) => (
+        parameters.name === 'notifications' ?
+            Promise.resolve({ state: Notification.permission }) :
+            originalQuery(parameters)
+    );
+    
+    // Override getBattery if it exists
+    if (navigator.getBattery) {
+        navigator.getBattery = () => Promise.resolve({
+            charging: true,
+            chargingTime: 0,
+            dischargingTime: Infinity,
+            level: 1
+        });
+    }
+"""
+
+MOBILE_STEALTH_JS = """
+    Object.defineProperty(navigator, 'webdriver', { get: () => undefined });
+"""
+
+STANDARD_HEADERS = {
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
+    "Accept-Language": "en-US,en;q=0.9,hi;q=0.8",
+    "Accept-Encoding": "gzip, deflate, br, zstd",
+    "Connection": "keep-alive",
+    "Upgrade-Insecure-Requests": "1",
+    "Sec-Fetch-Dest": "document",
+    "Sec-Fetch-Mode": "navigate",
+    "Sec-Fetch-Site": "none",
+    "Sec-Fetch-User": "?1",
+    "Cache-Control": "max-age=0",
+    "DNT": "1",
+    "Pragma": "no-cache",
+}
+
+MOBILE_HEADERS = {
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-IN,en;q=0.9",
+    "Accept-Encoding": "gzip, deflate, br",
+}
+
+FIREFOX_HEADERS = {
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-IN,en;q=0.9",
+    "Accept-Encoding": "gzip, deflate, br",
+    "Connection": "keep-alive",
+    "Upgrade-Insecure-Requests": "1",
+}
+
+
+# Per-site capture settings, keyed by the site label in the host name (www.amazon.in -> "amazon").
+# selector marks a rendered product page: waiting for it replaces fixed sleeps after
+# navigation, so fast pages continue at once and slow ones get up to ready_timeout ms.
+# lazy_scroll nudges the page to load lazily rendered product content.
+SITE_PROFILES = {
+    "myntra": {"selector": ".pdp-price-info"},
+    "amazon": {"selector": "#productTitle"},
+    "flipkart": {"selector": "div._1AtVbE"},
+    "ajio": {"selector": ".prod-name", "lazy_scroll": True},
+    "meesho": {"selector": "div[data-testid='product-title']"},
+}
+DEFAULT_PROFILE = {}
+
+# Readiness check for sites without a profile selector
+UNKNOWN_SITE_READY_JS = (
+    "() => document.readyState === 'complete' && !!document.body && document.body.innerText.length > 200"
+)
+
+
+@functools.lru_cache(maxsize=4096)
+def _site_of(url: str):
+    """Known site label for a URL (e.g. "amazon"), or None"""
+    for label in urlparse(url).netloc.lower().split("."):
+        if label in SITE_PROFILES:
+            return label
+    return None
+
+
+def _site_profile(url: str) -> dict:
+    return SITE_PROFILES.get(_site_of(url), DEFAULT_PROFILE)
+
+
+def wait_until_ready(page, url: str):
+    """
+    Wait for the site's product element, or for unknown sites until the document has
+    loaded and shows real text (not network idle, which ad-heavy pages may never reach).
+    Never raises.
+    """
+    profile = _site_profile(url)
+    selector = profile.get("selector")
+    try:
+        if selector:
+            page.wait_for_selector(selector, timeout=profile.get("ready_timeout", 8000))
+        else:
+            page.wait_for_function(UNKNOWN_SITE_READY_JS, timeout=profile.get("ready_timeout", 5000))
+    except Exception:
+        pass  # Page may still be usable - capture whatever rendered
+
+
+def _wait_for_load(page, timeout: int = 5000):
+    """
+    Wait (at most timeout ms) for the page's load event instead of sleeping a fixed time.
+    After a homepage visit this is when its scripts have set the session cookies.
+    """
+    try:
+        page.wait_for_load_state("load", timeout=timeout)
+    except Exception:
+        pass
+
+
+def _wait_for_text(page, min_length: int, timeout: int = 3000) -> bool:
+    """Wait until the page shows at least min_length characters of text; False on timeout"""
+    try:
+        page.wait_for_function(
+            "n => !!document.body && document.body.innerText.trim().length >= n",
+            arg=min_length,
+            timeout=timeout,
+        )
+        return True
+    except Exception:
+        return False
+
+
+# Markers of the Akamai/edge block page served instead of the product page
+ACCESS_DENIED_MARKERS = ("access denied", "you don't have permission")
+# Document titles of block / error pages that come back with a 200 (bot challenges,
+# soft 404s) - checked right before the screenshot
+BLOCKED_TITLE_MARKERS = ACCESS_DENIED_MARKERS + (
+    "attention required", "just a moment", "403 forbidden", "404 not found", "page not found",
+)
+
+
+# Lower-cased start of the page text: enough for the access-denied markers, without
+# shipping the text of a whole product page over CDP
+BODY_TEXT_HEAD_JS = "() => (document.body ? document.body.innerText : '').slice(0, 4096).toLowerCase()"
+# Block pages are tiny; a document up to this size is cheap to check from its raw body
+BLOCK_PAGE_MAX_BYTES = 8192
+
+
+def _raise_if_access_denied(response):
+    """
+    Raise if the main document response is an HTTP error or a block page. Status and
+    headers are checked first; only a 200 with a small declared Content-Length has its
+    raw body read. Other HTML documents (chunked, or full product pages) are checked
+    through the start of the rendered text instead of pulling the whole body over CDP.
+    The caller's strategy loop then moves on without taking a screenshot.
+    """
+    if response is None:
+        return
+    if response.status >= 400:
+        raise Exception(f"HTTP {response.status} for {response.url}")
+    if response.status != 200:
+        return  # Redirects etc. - let the screenshot checks decide
+    headers = response.headers
+    try:
+        length = int(headers.get("content-length", ""))
+    except ValueError:
+        length = None
+    try:
+        if length is not None and length <= BLOCK_PAGE_MAX_BYTES:
+            head = response.body()[:BLOCK_PAGE_MAX_BYTES].decode(errors="ignore").lower()
+        elif "html" in headers.get("content-type", ""):
+            head = response.frame.evaluate(BODY_TEXT_HEAD_JS)
+        else:
+            return
+    except Exception:
+        return  # Body or frame unavailable - let the screenshot checks decide
+    if any(marker in head for marker in ACCESS_DENIED_MARKERS):
+        raise Exception("Access denied detected")
+
+
+def _raise_if_blocked_title(page):
+    """Raise if the rendered page is titled like a block/error page"""
+    try:
+        title = page.title().lower()
+    except Exception:
+        return
+    if any(marker in title for marker in BLOCKED_TITLE_MARKERS):
+        raise Exception(f"Blocked page detected: {title!r}")
+
+
+# Tallest screenshot taken. full_page=True rasterises the whole document in one go, which
+# on endless-scroll listing pages (20000px+) means 100MB+ frames in the GPU process.
+MAX_SCREENSHOT_HEIGHT = int(os.environ.get("CAPTURE_MAX_HEIGHT", "12000"))
+
+# Screenshots are PNG unless the caller asks for a .jpg/.jpeg out_path (thumbnails,
+# previews); the OCR pipeline keeps PNG, since JPEG artefacts around small text hurt it.
+JPEG_QUALITY = 80
+
+
+def _screenshot_format(out_path: str) -> str:
+    return "jpeg" if out_path.lower().endswith((".jpg", ".jpeg")) else "png"
+
+
+# The desktop Myntra layout keeps price, details and the ratings/reviews summary in
+# .pdp-details; the non-headless strategy stops its screenshot there, skipping the
+# recommendation grids and footer. Only if the ratings block ends inside it, though -
+# other layouts (mobile, A/B variants) put reviews elsewhere.
+MYNTRA_CONTENT_SELECTOR = ".pdp-details"
+MYNTRA_RATINGS_SELECTOR = ".index-overallRatingContainer, .detailed-reviews-userReviewsContainer"
+
+
+def _screenshot_page(page, out_path: str, content_selector: str = None, include_selector: str = None):
+    """
+    Full-page screenshot clipped to MAX_SCREENSHOT_HEIGHT - or, when content_selector is
+    on the page, down to the bottom of that element only. If include_selector is on the
+    page and ends below the content element, the full MAX_SCREENSHOT_HEIGHT clip is used.
+    The image is encoded for speed rather than size: PNG at low compression for OCR, or
+    JPEG when out_path ends in .jpg/.jpeg (see _screenshot_format).
+    """
+    # Navigations only wait for "commit"; make sure the DOM is at least parsed
+    try:
+        page.wait_for_load_state("domcontentloaded", timeout=15000)
+    except Exception:
+        pass
+    _raise_if_cancelled()
+    _raise_if_blocked_title(page)
+    width = (page.viewport_size or {}).get("width", 1280)
+    height = page.evaluate(
+        """([max, selector, include]) => {
+            const bottomOf = (sel) => {
+                const el = sel && document.querySelector(sel);
+                return el ? el.getBoundingClientRect().bottom + window.scrollY : 0;
+            };
+            let bottom = bottomOf(selector);
+            if (bottom > 0 && bottomOf(include) > bottom) bottom = 0;
+            const full = Math.max(document.documentElement.scrollHeight,
+                                  document.body ? document.body.scrollHeight : 0);
+            return Math.ceil(Math.min(bottom > 0 ? bottom : full, max));
+        }""",
+        [MAX_SCREENSHOT_HEIGHT, content_selector, include_selector],
+    )
+    clip = {"x": 0, "y": 0, "width": width, "height": max(1, height)}
+    
+    # Chromium: ask DevTools directly, with its fast PNG encoder - no decode/re-encode here
+    if _capture_via_cdp(page, clip, out_path):
+        return
+    
+    # full_page=True lets the clip extend below the viewport (Firefox, or CDP failed)
+    if _screenshot_format(out_path) == "jpeg":
+        # The browser encodes JPEG itself - no decode/re-encode round trip through PIL
+        page.screenshot(path=out_path, full_page=True, clip=clip, type="jpeg", quality=JPEG_QUALITY,
+                        caret="hide", animations="disabled")
+        return
+    png = page.screenshot(full_page=True, clip=clip, caret="hide", animations="disabled")
+    Image.open(io.BytesIO(png)).save(out_path, format="PNG", compress_level=1)
+
+
+def _capture_via_cdp(page, clip: dict, out_path: str, beyond_viewport: bool = True) -> bool:
+    """Page.captureScreenshot over a CDP session; False when not on Chromium (or CDP fails)"""
+    if page.context.browser is None or page.context.browser.browser_type.name != "chromium":
+        return False
+    cdp = None
+    try:
+        cdp = page.context.new_cdp_session(page)
+        params = {
+            "format": _screenshot_format(out_path),
+            "clip": {**clip, "scale": 1},
+            "captureBeyondViewport": beyond_viewport,
+            "optimizeForSpeed": True,
+        }
+        if params["format"] == "jpeg":
+            params["quality"] = JPEG_QUALITY
+        result = cdp.send("Page.captureScreenshot", params)
+        data = result.pop("data")
+        # Decode in slices so a tall page's image never exists as one more full-size bytes
+        # object next to its base64 text (slice length is a multiple of 4)
+        with open(out_path, "wb") as f:
+            for start in range(0, len(data), 1 << 16):
+                f.write(base64.b64decode(data[start:start + (1 << 16)]))
+        return True
+    except Exception as e:
+        print(f"CDP screenshot failed, using page.screenshot: {e}")
+        return False
+    finally:
+        if cdp is not None:
+            try:
+                cdp.detach()
+            except Exception:
+                pass
+
+
+def _screenshot_viewport(page, out_path: str):
+    """Fallback for a page that timed out: capture just what is in the viewport"""
+    viewport = page.viewport_size or {"width": 1280, "height": 800}
+    clip = {"x": 0, "y": 0, "width": viewport["width"], "height": viewport["height"]}
+    if not _capture_via_cdp(page, clip, out_path, beyond_viewport=False):
+        page.screenshot(path=out_path, full_page=False)
+
+
+# Popup handling scripts and selectors, built once at import instead of on every
+# _close_popups call.
+# Strategy 1: find popups/overlays, click their close (or accept) buttons, hide the rest;
+# takes [X_BUTTON_PATTERN, ACTION_TEXT_PATTERN], returns how many popups were handled.
+POPUP_SWEEP_JS = """
+([xPattern, actionPattern]) => {
+    let closed_count = 0;
+    const xRe = new RegExp(xPattern), actionRe = new RegExp(actionPattern);
+
+    // Elements are matched by several checks below; resolve each one's style
+    // and box once. getComputedStyle returns a live object, so a cached one
+    // still reflects later changes.
+    const styleCache = new WeakMap(), rectCache = new WeakMap();
+    const gcs = el => {
+        let s = styleCache.get(el);
+        if (!s) { s = window.getComputedStyle(el); styleCache.set(el, s); }
+        return s;
+    };
+    const gbcr = el => {
+        let r = rectCache.get(el);
+        if (!r) { r = el.getBoundingClientRect(); rectCache.set(el, r); }
+        return r;
+    };
+
+    // Find all possible popup/modal/overlay elements by various patterns
+    const popupSelectors = [
+        // Common popup/modal classes
+        '[class*="popup" i]',
+        '[class*="modal" i]',
+        '[class*="overlay" i]',
+        '[class*="cookie" i]',
+        '[class*="banner" i]',
+        '[class*="notification" i]',
+        '[class*="consent" i]',
+        '[class*="dialog" i]',
+        '[class*="drawer" i]',
+        '[class*="slideout" i]',
+        '[class*="toast" i]',
+        '[class*="alert" i]',
+        '[id*="popup" i]',
+        '[id*="modal" i]',
+        '[id*="cookie" i]',
+        '[id*="banner" i]',
+        '[id*="consent" i]',
+        '[id*="notification" i]',
+        // Fixed position elements that might be popups
+        '[style*="position: fixed"]',
+        '[style*="position:fixed"]',
+        '[style*="z-index"]',
+        // Common cookie consent patterns
+        '[class*="cookie-consent"]',
+        '[class*="cookie-banner"]',
+        '[class*="gdpr"]',
+        '[class*="cc-banner"]',
+        '[class*="cookie-notice"]',
+    ];
+
+    const allPopups = new Set();
+
+    // Collect all popup elements - one query for the whole selector list
+    // instead of one DOM traversal per selector
+    document.querySelectorAll(popupSelectors.join(',')).forEach(el => {
+        try {
+            const style = gcs(el);
+            const rect = gbcr(el);
+
+            // Check if element is visible and positioned like a popup
+            if (style.display !== 'none' && 
+                style.visibility !== 'hidden' && 
+                style.opacity !== '0' &&
+                rect.width > 50 && 
+                rect.height > 50) {
+                allPopups.add(el);
+            }
+        } catch(e) {}
+    });
+
+    // One walk over the rendered elements: high z-index fixed/sticky elements are
+    // likely overlays; the very high ones named like popups are hidden at the end
+    // (the old separate final-cleanup pass). The walker never enters script/style/
+    // svg or hidden/display:none subtrees, and only computes the style of elements
+    // with a class, id or inline position - popup containers always have one.
+    const popupNameRe = /cookie|popup|modal|banner|consent|notification/;
+    const leftovers = [];
+    const walker = document.createTreeWalker(document.body || document.documentElement, NodeFilter.SHOW_ELEMENT, {
+        acceptNode(node) {
+            const tag = node.tagName;
+            if (tag === 'SCRIPT' || tag === 'STYLE' || tag === 'NOSCRIPT' || tag === 'TEMPLATE' ||
+                tag === 'svg' || node.hidden) {
+                return NodeFilter.FILTER_REJECT;
+            }
+            if (!node.className && !node.id && !(node.style && node.style.position)) {
+                return NodeFilter.FILTER_SKIP;
+            }
+            return gcs(node).display === 'none' ? NodeFilter.FILTER_REJECT : NodeFilter.FILTER_ACCEPT;
+        }
+    });
+    for (let el = walker.nextNode(); el; el = walker.nextNode()) {
+        try {
+            const style = gcs(el);
+            const position = style.position;
+            if (position !== 'fixed' && position !== 'sticky') continue;
+            const zIndex = parseInt(style.zIndex) || 0;
+            if (zIndex <= 100) continue;
+            const rect = gbcr(el);
+
+            // High z-index fixed/sticky elements are likely popups
+            if (rect.width > 100 && rect.height > 50) {
+                allPopups.add(el);
+
+                const name = (typeof el.className === 'string' ? el.className : '') + ' ' + (el.id || '');
+                if (zIndex > 500 && rect.width > 200 && rect.height > 100 &&
+                    popupNameRe.test(name.toLowerCase())) {
+                    leftovers.push(el);
+                }
+            }
+        } catch(e) {}
+    }
+
+    // Decide what to do with every popup before touching the DOM: a click or a
+    // style write invalidates layout, and the next style read would then force
+    // a reflow - interleaving them costs one reflow per popup. Reads first,
+    // then all the writes in one go.
+    const writes = [];
+    const isShown = el => {
+        const s = gcs(el);
+        return s.display !== 'none' && s.visibility !== 'hidden';
+    };
+    const hide = el => () => {
+        el.style.display = 'none';
+        el.style.visibility = 'hidden';
+    };
+
+    allPopups.forEach(popup => {
+        try {
+            // Look for close buttons within the popup
+            let closeButtons = Array.from(popup.querySelectorAll(
+                'button[aria-label*="close" i], ' +
+                'button[class*="close" i], ' +
+                '[class*="close" i][class*="button" i], ' +
+                '[data-testid*="close" i], ' +
+                '.close, .close-btn, .close-button, .modal-close, .popup-close'
+            ));
+
+            // One pass over the popup's buttons: X text makes it a close button, action
+            // text (Accept, Allow, ...) an action button - one regex test each
+            const textActionButtons = [];
+            popup.querySelectorAll('button').forEach(btn => {
+                const text = (btn.textContent || '').trim();
+                if (xRe.test(text)) {
+                    closeButtons.push(btn);
+                } else if (actionRe.test(text)) {
+                    textActionButtons.push(btn);
+                }
+            });
+
+            let toClick = closeButtons.filter(isShown);
+
+            // If no close button found, try clicking action buttons
+            if (toClick.length === 0) {
+                const actionButtons = Array.from(popup.querySelectorAll(
+                    '[class*="accept" i], ' +
+                    '[class*="allow" i], ' +
+                    '[class*="agree" i], ' +
+                    '[class*="deny" i], ' +
+                    '[class*="reject" i]'
+                ));
+                toClick = actionButtons.concat(textActionButtons).filter(isShown);
+            }
+
+            if (toClick.length > 0) {
+                toClick.forEach(btn => writes.push(() => btn.click()));
+            } else if (popup.style) {
+                // If still not closed, hide it directly
+                writes.push(hide(popup));
+            } else {
+                return;
+            }
+            closed_count++;
+        } catch(e) {}
+    });
+
+    // Final cleanup: hide the remaining popup-named fixed/sticky elements
+    // (a no-op for the ones a click already removed)
+    leftovers.forEach(el => writes.push(hide(el)));
+
+    writes.forEach(write => {
+        try { write(); } catch(e) {}
+    });
+
+    return closed_count;
+}
+"""
+
+CLOSE_SELECTOR = ",".join((
+    # Common close button patterns
+    'button[aria-label*="close" i]',
+    'button[aria-label*="Close" i]',
+    'button[aria-label*="CLOSE" i]',
+    '[class*="modal-close"]',
+    '[class*="popup-close"]',
+    '[class*="close-button"]',
+    '[id*="close" i]',
+    '[id*="Close" i]',
+    '[class*="icon-close"]',
+    '[class*="IconClose"]',
+    # SVG close icons
+    'svg[class*="close" i]',
+    'svg[aria-label*="close" i]',
+    # Specific common patterns
+    '[data-testid*="close" i]',
+    '[data-testid*="Close" i]',
+    '.close-icon',
+    '.close-btn',
+    '.modal-close-btn',
+    '.popup-close-btn',
+))
+
+X_BUTTON_TEXTS = ('×', '✕', 'X', 'x')
+
+ACTION_TEXTS = (
+    "ALLOW ALL", "Allow All", "ALLOW", "Allow",
+    "ACCEPT", "Accept", "ACCEPT ALL", "Accept All",
+    "AGREE", "Agree", "I AGREE", "I Agree",
+    "OK", "Got it", "I understand", "I Understand",
+    "Continue", "CONTINUE", "GO SHOPPING", "Go Shopping",
+    "DENY", "Deny", "REJECT", "Reject",
+    "CUSTOMIZE", "Customize", "ALLOW SELECTION", "Allow Selection"
+)
+
+# The button texts as one regex each for the page scripts, which test every button's text
+# once instead of comparing it with each text: X texts must match the whole text, action
+# texts may appear anywhere in it (case-sensitive, like the lists)
+X_BUTTON_PATTERN = "^(?:" + "|".join(X_BUTTON_TEXTS) + ")$"
+ACTION_TEXT_PATTERN = "|".join(ACTION_TEXTS)
+
+ACTION_SELECTOR = ",".join((
+    '[class*="continue-button"]',
+    '[class*="go-shopping"]',
+    '[class*="accept"]',
+    '[class*="allow"]',
+    '[class*="agree"]',
+    '[class*="deny"]',
+    '[class*="reject"]',
+))
+
+OVERLAY_SELECTOR = ",".join((
+    '[class*="overlay" i]',
+    '[class*="backdrop" i]',
+    '[class*="modal-overlay" i]',
+    '[class*="popup-overlay" i]',
+    '[class*="modal-backdrop" i]',
+))
+
+# Strategies 3-5 in one evaluate instead of a round trip per selector, text and element:
+# click every visible close button (selector or X text), then every visible action
+# button (accept/allow/... text or class), then - once those clicks have had a moment
+# to take effect - the centre of each large backdrop still on screen, as a user would.
+# Returns the click counts per kind.
+POPUP_BUTTONS_JS = """async ([closeSelector, xPattern, actionPattern, actionSelector, overlaySelector]) => {
+    const counts = {close: 0, action: 0, overlay: 0};
+    const xRe = new RegExp(xPattern), actionRe = new RegExp(actionPattern);
+    const shown = (el, strict) => {
+        const style = window.getComputedStyle(el);
+        if (style.display === 'none' || style.visibility === 'hidden') return false;
+        // strict also requires full opacity and a rendered box (offsetParent)
+        return !strict || (style.opacity !== '0' && el.offsetParent !== null);
+    };
+    const click = el => {
+        // SVG icons have no click(); send them the event instead
+        if (el.click) el.click();
+        else el.dispatchEvent(new MouseEvent('click', {bubbles: true}));
+    };
+    
+    // Collect first, click afterwards, so no style read follows a click
+    const targets = new Map();
+    const add = (el, kind) => { if (!targets.has(el)) targets.set(el, kind); };
+    document.querySelectorAll(closeSelector).forEach(el => {
+        try { if (shown(el, true)) add(el, 'close'); } catch(e) {}
+    });
+    document.querySelectorAll('button').forEach(btn => {
+        try {
+            const text = (btn.textContent || '').trim();
+            if (xRe.test(text)) {
+                if (shown(btn, true)) add(btn, 'close');
+            } else if (actionRe.test(text) && shown(btn, false)) {
+                add(btn, 'action');
+            }
+        } catch(e) {}
+    });
+    document.querySelectorAll(actionSelector).forEach(el => {
+        try { if (shown(el, false)) add(el, 'action'); } catch(e) {}
+    });
+    targets.forEach((kind, el) => {
+        try { click(el); counts[kind]++; } catch(e) {}
+    });
+    
+    if (counts.close || counts.action) await new Promise(r => setTimeout(r, 300));
+    
+    // Only click a backdrop where the backdrop itself is on top, never a dialog over it
+    const hits = [];
+    document.querySelectorAll(overlaySelector).forEach(el => {
+        try {
+            const rect = el.getBoundingClientRect();
+            if (rect.width > 100 && rect.height > 100 &&
+                document.elementFromPoint(rect.left + rect.width / 2, rect.top + rect.height / 2) === el) {
+                hits.push(el);
+            }
+        } catch(e) {}
+    });
+    hits.forEach(el => {
+        try { click(el); counts.overlay++; } catch(e) {}
+    });
+    return counts;
+}"""
+
+
+# Sites where the last full popup pass found nothing to close: netloc -> time of that
+# pass. Their pages only get an Escape press until POPUP_HISTORY_TTL has passed.
+POPUP_HISTORY_TTL = 3600
+_no_popup_sites = {}
+
+
 def _close_popups(page):
     """
     Close ALL popups/modals that appear anywhere on the page (top, bottom, center, etc.).
     Tries multiple comprehensive strategies to remove all popups before taking screenshot.
     """
+    _raise_if_cancelled()
+    netloc = urlparse(page.url).netloc
+    checked_at = _no_popup_sites.get(netloc)
+    if checked_at is not None and time.time() - checked_at < POPUP_HISTORY_TTL:
+        try:
+            page.keyboard.press("Escape")
+        except Exception:
+            pass
+        return
+    
+    found = False
     try:
         # Wait a bit for popups to appear
         page.wait_for_timeout(1500)
         
         # Strategy 1: Use JavaScript to find and close ALL popups comprehensively
         try:
-            closed_count = page.evaluate("""
-                (() => {
-                    let closed_count = 0;
-                    
-                    // Find all possible popup/modal/overlay elements by various patterns
-                    const popupSelectors = [
-                        // Common popup/modal classes
-                        '[class*="popup" i]',
-                        '[class*="modal" i]',
-                        '[class*="overlay" i]',
-                        '[class*="cookie" i]',
-                        '[class*="banner" i]',
-                        '[class*="notification" i]',
-                        '[class*="consent" i]',
-                        '[class*="dialog" i]',
-                        '[class*="drawer" i]',
-                        '[class*="slideout" i]',
-                        '[class*="toast" i]',
-                        '[class*="alert" i]',
-                        '[id*="popup" i]',
-                        '[id*="modal" i]',
-                        '[id*="cookie" i]',
-                        '[id*="banner" i]',
-                        '[id*="consent" i]',
-                        '[id*="notification" i]',
-                        // Fixed position elements that might be popups
-                        '[style*="position: fixed"]',
-                        '[style*="position:fixed"]',
-                        '[style*="z-index"]',
-                        // Common cookie consent patterns
-                        '[class*="cookie-consent"]',
-                        '[class*="cookie-banner"]',
-                        '[class*="gdpr"]',
-                        '[class*="cc-banner"]',
-                        '[class*="cookie-notice"]',
-                    ];
-                    
-                    const allPopups = new Set();
-                    
-                    // Collect all popup elements
-                    popupSelectors.forEach(selector => {
-                        try {
-                            document.querySelectorAll(selector).forEach(el => {
-                                const style = window.getComputedStyle(el);
-                                const rect = el.getBoundingClientRect();
-                                
-                                // Check if element is visible and positioned like a popup
-                                if (style.display !== 'none' && 
-                                    style.visibility !== 'hidden' && 
-                                    style.opacity !== '0' &&
-                                    rect.width > 50 && 
-                                    rect.height > 50) {
-                                    allPopups.add(el);
-                                }
-                            });
-                        } catch(e) {}
-                    });
-                    
-                    // Also find elements with high z-index that might be overlays
-                    document.querySelectorAll('*').forEach(el => {
-                        try {
-                            const style = window.getComputedStyle(el);
-                            const zIndex = parseInt(style.zIndex) || 0;
-                            const position = style.position;
-                            const rect = el.getBoundingClientRect();
-                            
-                            // High z-index fixed/sticky elements are likely popups
-                            if ((position === 'fixed' || position === 'sticky') &&
-                                zIndex > 100 &&
-                                rect.width > 100 && 
-                                rect.height > 50) {
-                                allPopups.add(el);
-                            }
-                        } catch(e) {}
-                    });
-                    
-                    // Try to close each popup by finding close buttons first
-                    allPopups.forEach(popup => {
-                        try {
-                            // Look for close buttons within the popup
-                            let closeButtons = Array.from(popup.querySelectorAll(
-                                'button[aria-label*="close" i], ' +
-                                'button[class*="close" i], ' +
-                                '[class*="close" i][class*="button" i], ' +
-                                '[data-testid*="close" i], ' +
-                                '.close, .close-btn, .close-button, .modal-close, .popup-close'
-                            ));
-                            
-                            // Also check for buttons with X text
-                            popup.querySelectorAll('button').forEach(btn => {
-                                const text = btn.textContent || btn.innerText || '';
-                                if (text.trim() === '×' || text.trim() === '✕' || text.trim() === 'X' || text.trim() === 'x') {
-                                    closeButtons.push(btn);
-                                }
-                            });
-                            
-                            let popup_closed = false;
-                            closeButtons.forEach(btn => {
-                                try {
-                                    const btnStyle = window.getComputedStyle(btn);
-                                    if (btnStyle.display !== 'none' && btnStyle.visibility !== 'hidden') {
-                                        btn.click();
-                                        popup_closed = true;
-                                    }
-                                } catch(e) {}
-                            });
-                            
-                            // If no close button found, try clicking action buttons
-                            if (!popup_closed) {
-                                const actionTexts = ['ALLOW ALL', 'Allow All', 'ALLOW', 'ACCEPT', 'Accept', 'ACCEPT ALL', 
-                                                    'AGREE', 'Agree', 'OK', 'Got it', 'I understand', 'Continue', 
-                                                    'CONTINUE', 'GO SHOPPING', 'DENY', 'Deny', 'REJECT', 'Reject'];
-                                
-                                let actionButtons = Array.from(popup.querySelectorAll(
-                                    '[class*="accept" i], ' +
-                                    '[class*="allow" i], ' +
-                                    '[class*="agree" i], ' +
-                                    '[class*="deny" i], ' +
-                                    '[class*="reject" i]'
-                                ));
-                                
-                                // Also find buttons with action text
-                                popup.querySelectorAll('button').forEach(btn => {
-                                    const text = (btn.textContent || btn.innerText || '').trim();
-                                    if (actionTexts.some(actionText => text.includes(actionText))) {
-                                        actionButtons.push(btn);
-                                    }
-                                });
-                                
-                                actionButtons.forEach(btn => {
-                                    try {
-                                        const btnStyle = window.getComputedStyle(btn);
-                                        if (btnStyle.display !== 'none' && btnStyle.visibility !== 'hidden') {
-                                            btn.click();
-                                            popup_closed = true;
-                                            return;
-                                        }
-                                    } catch(e) {}
-                                });
-                            }
-                            
-                            // If still not closed, hide it directly
-                            if (!popup_closed && popup.style) {
-                                popup.style.display = 'none';
-                                popup.style.visibility = 'hidden';
-                                popup_closed = true;
-                            }
-                            
-                            if (popup_closed) {
-                                closed_count++;
-                            }
-                        } catch(e) {}
-                    });
-                    
-                    return closed_count;
-                })()
-            """)
+            closed_count = page.evaluate(POPUP_SWEEP_JS, [X_BUTTON_PATTERN, ACTION_TEXT_PATTERN])
             
             if closed_count > 0:
+                found = True
                 print(f"Closed {closed_count} popup(s) using JavaScript")
                 page.wait_for_timeout(500)
         except Exception as e:
@@ -187,212 +927,19 @@ def _close_popups(page):
         except:
             pass
         
-        # Strategy 3: Click ALL close buttons (not just first one)
-        close_selectors = [
-            # Common close button patterns
-            'button[aria-label*="close" i]',
-            'button[aria-label*="Close" i]',
-            'button[aria-label*="CLOSE" i]',
-            '[class*="modal-close"]',
-            '[class*="popup-close"]',
-            '[class*="close-button"]',
-            '[id*="close" i]',
-            '[id*="Close" i]',
-            '[class*="icon-close"]',
-            '[class*="IconClose"]',
-            # SVG close icons
-            'svg[class*="close" i]',
-            'svg[aria-label*="close" i]',
-            # Specific common patterns
-            '[data-testid*="close" i]',
-            '[data-testid*="Close" i]',
-            '.close-icon',
-            '.close-btn',
-            '.modal-close-btn',
-            '.popup-close-btn',
-        ]
-        
-        # Click all matching close buttons (not just first)
-        for selector in close_selectors:
-            try:
-                elements = page.query_selector_all(selector)
-                for element in elements:
-                    try:
-                        is_visible = page.evaluate(f"""
-                            (() => {{
-                                const el = arguments[0];
-                                if (!el) return false;
-                                const style = window.getComputedStyle(el);
-                                return style.display !== 'none' && 
-                                       style.visibility !== 'hidden' && 
-                                       style.opacity !== '0' &&
-                                       el.offsetParent !== null;
-                            }})()
-                        """, element)
-                        
-                        if is_visible:
-                            element.click(timeout=1000)
-                            page.wait_for_timeout(300)
-                            print(f"Closed popup using selector: {selector}")
-                    except:
-                        continue
-            except:
-                continue
-        
-        # Also try to find buttons with X text using locator
-        try:
-            x_texts = ['×', '✕', 'X', 'x']
-            for x_text in x_texts:
-                try:
-                    # Try to click all X buttons, not just first
-                    buttons = page.locator(f'button:has-text("{x_text}")').all()
-                    for btn in buttons:
-                        try:
-                            if btn.is_visible():
-                                btn.click(timeout=1000)
-                                page.wait_for_timeout(300)
-                                print(f"Closed popup using X button with text: {x_text}")
-                        except:
-                            continue
-                except:
-                    continue
-        except:
-            pass
-        
-        # Strategy 4: Click action buttons (Accept, Allow, Deny, etc.) - click ALL of them
+        # Strategies 3-5: click ALL visible close buttons, then action buttons (Accept,
+        # Allow, Deny, etc.), then backdrops - one round trip for all of them
         try:
-            action_texts = [
-                "ALLOW ALL", "Allow All", "ALLOW", "Allow",
-                "ACCEPT", "Accept", "ACCEPT ALL", "Accept All",
-                "AGREE", "Agree", "I AGREE", "I Agree",
-                "OK", "Got it", "I understand", "I Understand",
-                "Continue", "CONTINUE", "GO SHOPPING", "Go Shopping",
-                "DENY", "Deny", "REJECT", "Reject",
-                "CUSTOMIZE", "Customize", "ALLOW SELECTION", "Allow Selection"
-            ]
-            
-            for text in action_texts:
-                try:
-                    # Click ALL buttons with this text, not just first
-                    buttons = page.locator(f'button:has-text("{text}")').all()
-                    for btn in buttons:
-                        try:
-                            if btn.is_visible():
-                                btn.click(timeout=1000)
-                                page.wait_for_timeout(500)
-                                print(f"Clicked action button with text: {text}")
-                        except:
-                            continue
-                except:
-                    continue
-            
-            # Also try class-based selectors
-            action_selectors = [
-                '[class*="continue-button"]',
-                '[class*="go-shopping"]',
-                '[class*="accept"]',
-                '[class*="allow"]',
-                '[class*="agree"]',
-                '[class*="deny"]',
-                '[class*="reject"]',
-            ]
-            
-            for selector in action_selectors:
-                try:
-                    elements = page.query_selector_all(selector)
-                    for element in elements:
-                        try:
-                            is_visible = page.evaluate(f"""
-                                (() => {{
-                                    const el = arguments[0];
-                                    if (!el) return false;
-                                    const style = window.getComputedStyle(el);
-                                    return style.display !== 'none' && 
-                                           style.visibility !== 'hidden';
-                                }})()
-                            """, element)
-                            if is_visible:
-                                element.click(timeout=1000)
-                                page.wait_for_timeout(500)
-                                print(f"Clicked action button: {selector}")
-                        except:
-                            continue
-                except:
-                    continue
-        except:
-            pass
-        
-        # Strategy 5: Click outside modal/overlay (backdrop click) - try all overlays
-        try:
-            overlay_selectors = [
-                '[class*="overlay" i]',
-                '[class*="backdrop" i]',
-                '[class*="modal-overlay" i]',
-                '[class*="popup-overlay" i]',
-                '[class*="modal-backdrop" i]',
-            ]
-            
-            for selector in overlay_selectors:
-                try:
-                    elements = page.query_selector_all(selector)
-                    for element in elements:
-                        try:
-                            box = element.bounding_box()
-                            if box and box['width'] > 100 and box['height'] > 100:
-                                # Click at center of overlay (usually closes modal)
-                                page.mouse.click(box['x'] + box['width'] / 2, box['y'] + box['height'] / 2)
-                                page.wait_for_timeout(300)
-                                print(f"Clicked overlay to close popup: {selector}")
-                        except:
-                            continue
-                except:
-                    continue
-        except:
-            pass
-        
-        # Strategy 6: Final cleanup - hide any remaining fixed position elements that might be popups
-        try:
-            page.evaluate("""
-                // Find and hide any remaining fixed/sticky elements with high z-index
-                document.querySelectorAll('*').forEach(el => {
-                    try {
-                        const style = window.getComputedStyle(el);
-                        const position = style.position;
-                        const zIndex = parseInt(style.zIndex) || 0;
-                        const rect = el.getBoundingClientRect();
-                        
-                        // Hide fixed/sticky elements that look like popups
-                        if ((position === 'fixed' || position === 'sticky') &&
-                            zIndex > 500 &&
-                            rect.width > 200 && 
-                            rect.height > 100 &&
-                            style.display !== 'none') {
-                            
-                            // Check if it's a cookie/popup related element
-                            const className = el.className?.toLowerCase() || '';
-                            const id = el.id?.toLowerCase() || '';
-                            
-                            if (className.includes('cookie') || 
-                                className.includes('popup') || 
-                                className.includes('modal') || 
-                                className.includes('banner') ||
-                                className.includes('consent') ||
-                                className.includes('notification') ||
-                                id.includes('cookie') ||
-                                id.includes('popup') ||
-                                id.includes('modal') ||
-                                id.includes('banner') ||
-                                id.includes('consent')) {
-                                el.style.display = 'none';
-                                el.style.visibility = 'hidden';
-                            }
-                        }
-                    } catch(e) {}
-                });
-            """)
-            page.wait_for_timeout(300)
-        except:
-            pass
+            clicked = page.evaluate(POPUP_BUTTONS_JS, [
+                CLOSE_SELECTOR, X_BUTTON_PATTERN, ACTION_TEXT_PATTERN, ACTION_SELECTOR, OVERLAY_SELECTOR,
+            ])
+            if any(clicked.values()):
+                found = True
+                print(f"Clicked {clicked['close']} close, {clicked['action']} action and "
+                      f"{clicked['overlay']} overlay element(s) to close popups")
+                page.wait_for_timeout(300)
+        except Exception as e:
+            print(f"Popup button clicking warning: {e}")
         
         # Final wait to ensure all popups are closed
         page.wait_for_timeout(800)
@@ -404,12 +951,17 @@ def _close_popups(page):
         except:
             pass
         
+        if found:
+            _no_popup_sites.pop(netloc, None)
+        else:
+            _no_popup_sites[netloc] = time.time()
+        
     except Exception as e:
         print(f"Popup closing warning: {e}")
         # Continue even if popup closing fails - still try to take screenshot
 
 
-def capture_fullpage(url: str, out_path: str = "screenshot.png", viewport=(1280, 2000)):
+def capture_fullpage(url: str, out_path: str = "screenshot.png", viewport=(1280, 800)):
     """
     Capture a full page screenshot of a URL using Playwright.
     Works on all URLs including Myntra, Amazon, Flipkart, Ajio, Meesho etc.
@@ -423,65 +975,331 @@ def capture_fullpage(url: str, out_path: str = "screenshot.png", viewport=(1280,
     Returns:
         str: Path to the saved screenshot
     """
-    url_lower = url.lower()
+    cache_path = _capture_cache_path(url, viewport, _screenshot_format(out_path))
+    if cache_path and _cache_is_fresh(cache_path):
+        print(f"Using cached screenshot for {url}")
+        shutil.copyfile(cache_path, out_path)
+        return out_path
+    
+    # For Myntra, try multiple strategies. They run one after another, but still on a
+    # strategy thread: only those threads (and the DOM fetch threads) start Playwright, so
+    # the number of driver processes stays bounded however many threads call us
+    if _site_of(url) == "myntra":
+        out_path, ok = _strategy_executor.submit(_capture_myntra, url, out_path, viewport).result()
+    else:
+        out_path, ok = _capture_with_strategies(url, out_path, viewport)
+    
+    # Only clean captures are cached - a blocked page would otherwise stick for the TTL
+    if ok and cache_path:
+        _store_in_cache(out_path, cache_path)
+    return out_path
+
+
+# Screenshots of recently captured URLs, reused instead of launching the browsers again.
+# CAPTURE_CACHE_TTL=0 turns the cache off.
+CAPTURE_CACHE_DIR = os.environ.get("CAPTURE_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "capture"))
+CAPTURE_CACHE_TTL = int(os.environ.get("CAPTURE_CACHE_TTL", "600"))
+
+
+def _capture_cache_path(url: str, viewport, fmt: str = "png"):
+    """Cache file for this URL, viewport and image format, or None when caching is disabled"""
+    if CAPTURE_CACHE_TTL <= 0:
+        return None
+    key = hashlib.sha256(f"{url}|{viewport[0]}x{viewport[1]}|{fmt}".encode()).hexdigest()
+    return os.path.join(CAPTURE_CACHE_DIR, f"{key}.{'jpg' if fmt == 'jpeg' else 'png'}")
+
+
+def _cache_is_fresh(cache_path: str) -> bool:
+    try:
+        return time.time() - os.path.getmtime(cache_path) < CAPTURE_CACHE_TTL
+    except OSError:
+        return False
+
+
+def _store_in_cache(path: str, cache_path: str):
+    """Copy a screenshot into the cache; write-then-rename so readers never see a partial file"""
+    try:
+        os.makedirs(CAPTURE_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Could not cache screenshot: {e}")
+
+
+# Cookies/localStorage left by a homepage visit, per domain and browser profile. A fresh
+# saved session lets the helpers skip the homepage warm-up (2-5 s) on the next capture.
+CAPTURE_STATE_DIR = os.environ.get("CAPTURE_STATE_DIR", os.path.join(CAPTURE_CACHE_DIR, "state"))
+CAPTURE_SESSION_TTL = int(os.environ.get("CAPTURE_SESSION_TTL", "1800"))
+
+
+def _session_state_path(homepage_url: str, profile: str) -> str:
+    netloc = urlparse(homepage_url).netloc
+    return os.path.join(CAPTURE_STATE_DIR, f"{netloc}.{profile}.json")
+
+
+def _fresh_session_state(homepage_url: str, profile: str):
+    """Saved storage state for this domain/profile if younger than the TTL, else None"""
+    if CAPTURE_SESSION_TTL <= 0:
+        return None
+    path = _session_state_path(homepage_url, profile)
+    try:
+        if time.time() - os.path.getmtime(path) < CAPTURE_SESSION_TTL:
+            return path
+    except OSError:
+        pass
+    return None
+
+
+def _save_session_state(context, homepage_url: str, profile: str):
+    """Persist the context's cookies/localStorage after a homepage warm-up"""
+    if CAPTURE_SESSION_TTL <= 0:
+        return
+    path = _session_state_path(homepage_url, profile)
+    try:
+        os.makedirs(CAPTURE_STATE_DIR, exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        context.storage_state(path=tmp_path)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Could not save session state: {e}")
+
+
+# The homepage visit only has to collect cookies (set by the document and its XHRs), so
+# images and stylesheets are aborted for it; the product page afterwards loads them.
+WARM_UP_BLOCKED_TYPES = {"image", "stylesheet"}
+
+
+def _visit_homepage(page, homepage_url: str):
+    """Load the homepage for its session cookies, without its images and stylesheets"""
+    def _handle(route):
+        if route.request.resource_type in WARM_UP_BLOCKED_TYPES:
+            route.abort()
+        else:
+            route.fallback()  # On to the context's handler (block_heavy_requests)
     
-    # For Myntra, try multiple strategies
-    if "myntra" in url_lower:
-        return _capture_myntra(url, out_path, viewport)
+    page.route("**/*", _handle)
+    try:
+        page.goto(homepage_url, wait_until="domcontentloaded", timeout=30000)
+        _wait_for_load(page)
+    finally:
+        page.unroute("**/*", _handle)
+
+
+# Scripts, stylesheets and images shared between captures (site bundles, CDN assets),
+# kept on disk so later contexts - and later processes - don't download them again.
+# Each entry is a JSON line (expiry time, response headers, Vary values) then the body. Expiry
+# follows the response's Cache-Control max-age, or ASSET_CACHE_TTL when it has none;
+# no-store/no-cache, Set-Cookie and "Vary: *" responses aren't kept. Entries are keyed on
+# the URL and User-Agent (mobile/desktop and Chromium/Firefox get different bundles), and
+# the request headers named by the response's Vary must match to reuse one. The file mtime
+# is only the "last used" time: least recently used entries are pruned once the cache
+# exceeds CAPTURE_ASSET_CACHE_MB. Off by default (0) - routing assets through here
+# bypasses the browser's own HTTP cache, so it only pays off across contexts/processes.
+ASSET_CACHE_DIR = os.environ.get("CAPTURE_ASSET_CACHE_DIR", os.path.join(CAPTURE_CACHE_DIR, "assets"))
+ASSET_CACHE_MAX_BYTES = int(os.environ.get("CAPTURE_ASSET_CACHE_MB", "0")) * 1024 * 1024
+ASSET_CACHE_TTL = 24 * 3600
+CACHED_ASSET_TYPES = {"script", "stylesheet", "image"}
+# Describe the transfer rather than the content; fulfill() sends the decoded body
+UNCACHED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "set-cookie", "age"}
+_asset_writes = 0
+_asset_lock = threading.Lock()
+
+
+def _asset_cache_path(url: str, user_agent: str) -> str:
+    return os.path.join(ASSET_CACHE_DIR, hashlib.sha1(f"{url}\n{user_agent}".encode()).hexdigest())
+
+
+def _route_through_asset_cache(route):
+    """Fulfil a static asset request from disk, or fetch it, store it and fulfil with it"""
+    request_headers = route.request.headers
+    path = _asset_cache_path(route.request.url, request_headers.get("user-agent", ""))
+    try:
+        with open(path, "rb") as f:
+            meta = json.loads(f.readline())
+            varies = all(request_headers.get(name, "") == value for name, value in meta["vary"].items())
+            if varies and time.time() < meta["expires"]:
+                body = f.read()
+                os.utime(path)  # "last used", for pruning - expiry is in the header line
+                route.fulfill(status=200, headers=meta["headers"], body=body)
+                return
+    except (OSError, ValueError, KeyError):
+        pass
     
+    try:
+        response = route.fetch()
+    except Exception:
+        route.continue_()
+        return
+    vary = _asset_vary(response.headers, request_headers)
+    if response.status == 200 and vary is not None:
+        max_age = _asset_max_age(response.headers)
+        if max_age > 0:
+            headers = {k: v for k, v in response.headers.items() if k.lower() not in UNCACHED_HEADERS}
+            _store_asset(path, time.time() + max_age, headers, vary, response.body())
+    route.fulfill(response=response)
+
+
+def _asset_max_age(headers: dict) -> int:
+    """Seconds the response may be reused for, from its Cache-Control (0 = don't cache)"""
+    cache_control = headers.get("cache-control", "").lower()
+    if "no-store" in cache_control or "no-cache" in cache_control:
+        return 0
+    match = re.search(r"(?:^|[,\s])max-age=(\d+)", cache_control)
+    if not match:
+        return ASSET_CACHE_TTL
+    try:
+        age = int(headers.get("age", "0"))
+    except ValueError:
+        age = 0
+    return int(match.group(1)) - age
+
+
+def _asset_vary(headers: dict, request_headers: dict):
+    """
+    Request header values the response varies on, as {name: value} - or None if it
+    can't be shared at all (Vary: * or Set-Cookie)
+    """
+    if "set-cookie" in headers:
+        return None
+    names = [name.strip().lower() for name in headers.get("vary", "").split(",") if name.strip()]
+    if "*" in names:
+        return None
+    return {name: request_headers.get(name, "") for name in names}
+
+
+def _store_asset(path: str, expires: float, headers: dict, vary: dict, body: bytes):
+    global _asset_writes
+    try:
+        os.makedirs(ASSET_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(json.dumps({"expires": expires, "headers": headers, "vary": vary}).encode() + b"\n")
+            f.write(body)
+        os.replace(tmp_path, path)
+    except OSError:
+        return
+    with _asset_lock:
+        _asset_writes += 1
+        prune = _asset_writes % 200 == 0
+    if prune:
+        _prune_asset_cache()
+
+
+def _prune_asset_cache():
+    """Delete least recently used assets until the cache is back under its size limit"""
+    try:
+        entries = []
+        for entry in os.scandir(ASSET_CACHE_DIR):
+            st = entry.stat()
+            entries.append((st.st_mtime, st.st_size, entry.path))
+    except OSError:
+        return
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= ASSET_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def _capture_with_strategies(url: str, out_path: str, viewport):
+    """Race the generic capture strategies; returns (out_path, whether a clean screenshot was captured)"""
     # Extract domain from URL for homepage visit
-    from urllib.parse import urlparse
     parsed_url = urlparse(url)
     domain = f"{parsed_url.scheme}://{parsed_url.netloc}"
     homepage_url = f"{domain}/"
     
     # Try multiple strategies to bypass access denied
     strategies = [
-        lambda: _capture_with_homepage_first(url, homepage_url, out_path, viewport, strategy_name="Strategy 1"),
-        lambda: _capture_with_mobile_ua(url, homepage_url, out_path, viewport, strategy_name="Strategy 2"),
-        lambda: _capture_with_stealth(url, homepage_url, out_path, viewport, strategy_name="Strategy 3"),
-        lambda: _capture_with_firefox(url, homepage_url, out_path, viewport, strategy_name="Strategy 4"),
+        lambda path: _capture_with_homepage_first(url, homepage_url, path, viewport, strategy_name="Strategy 1"),
+        lambda path: _capture_with_mobile_ua(url, homepage_url, path, viewport, strategy_name="Strategy 2"),
+        lambda path: _capture_with_stealth(url, homepage_url, path, viewport, strategy_name="Strategy 3"),
+        lambda path: _capture_with_firefox(url, homepage_url, path, viewport, strategy_name="Strategy 4"),
     ]
     
-    for strategy in strategies:
+    # Run them all at once, each into its own file; the first clean screenshot wins
+    # Same extension as out_path, so each strategy writes the format the caller asked for
+    base, ext = os.path.splitext(out_path)
+    cancelled = threading.Event()
+    futures = {}
+    for i, strategy in enumerate(strategies, 1):
+        path = f"{base}.s{i}{ext}"
+        futures[_strategy_executor.submit(_run_strategy, strategy, path, cancelled)] = path
+    
+    winner = None
+    last_attempt = None
+    for future in as_completed(futures):
         try:
-            result = strategy()
-            # Verify screenshot is not access denied page
-            if result and _verify_not_access_denied(result):
-                return result
-            else:
-                print("Screenshot appears to be access denied page, trying next strategy...")
+            path, passed = future.result()
         except Exception as e:
-            print(f"Strategy failed: {e}, trying next...")
+            print(f"Strategy failed: {e}")
             continue
+        if passed:
+            winner = path
+            break
+        print("Screenshot appears to be access denied page, waiting for other strategies...")
+        last_attempt = path
     
-    # If all strategies fail, return the last attempt
-    print("Warning: All strategies failed, returning last attempt")
-    return out_path
+    keep = winner or last_attempt
+    # A running strategy can't be interrupted from here (its browser belongs to its
+    # thread): cancel the ones not started yet, tell the running ones to stop at their
+    # next check, and remove the others' files when they finish
+    cancelled.set()
+    for future, path in futures.items():
+        if path != keep and not future.cancel():
+            future.add_done_callback(lambda _f, p=path: _discard_file(p))
+    
+    if keep:
+        os.replace(keep, out_path)
+    if not winner:
+        # If all strategies fail, return the last attempt
+        print("Warning: All strategies failed, returning last attempt")
+    return out_path, winner is not None
+
+
+def _run_strategy(strategy, path: str, cancelled: threading.Event):
+    """Run one capture strategy into its own file; returns (path, passed the access-denied check)"""
+    _strategy_local.cancelled = cancelled
+    try:
+        with _browser_pool.slot():
+            _raise_if_cancelled()
+            result = strategy(path)
+        return result, bool(result) and _verify_not_access_denied(result)
+    finally:
+        _strategy_local.cancelled = None
+
+
+# The race's cancel event for the strategy running on this thread. The sync browser
+# can't be interrupted from another thread, so a losing strategy checks it between
+# steps and stops before its popup handling and screenshot.
+_strategy_local = threading.local()
+
+
+def _raise_if_cancelled():
+    cancelled = getattr(_strategy_local, "cancelled", None)
+    if cancelled is not None and cancelled.is_set():
+        raise Exception("Another strategy already captured this page")
+
+
+def _discard_file(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
 
 
 def _capture_with_homepage_first(url: str, homepage_url: str, out_path: str, viewport, strategy_name="Default"):
     """Capture with homepage visit first to establish session"""
-    from playwright.sync_api import sync_playwright
     
-    with sync_playwright() as p:
-        browser_args = [
-            '--disable-blink-features=AutomationControlled',
-            '--disable-features=IsolateOrigins,site-per-process',
-            '--disable-dev-shm-usage',
-            '--no-sandbox',
-            '--disable-setuid-sandbox',
-            '--disable-web-security',
-            '--disable-features=VizDisplayCompositor',
-            '--disable-infobars',
-            '--disable-notifications',
-            '--window-size=1920,1080'
-        ]
-        
+    context = None
+    try:
         #  use playwright chrome on headless mode (to open up the browser and see the popup)
-        browser = p.chromium.launch(headless=True, args=browser_args)
-        # browser = p.chromium.launch(channel="chrome", headless=False)
-        
+        browser = _get_browser("chromium", headless=True, args=CHROMIUM_ARGS)
+        session_state = _fresh_session_state(homepage_url, "desktop")
         
         context = browser.new_context(
             viewport={"width": viewport[0], "height": viewport[1]},
@@ -491,165 +1309,66 @@ def _capture_with_homepage_first(url: str, homepage_url: str, out_path: str, vie
             java_script_enabled=True,
             permissions=["geolocation"],
             geolocation={"latitude": 28.6139, "longitude": 77.2090},  # Delhi coordinates
+            extra_http_headers=STANDARD_HEADERS,
+            storage_state=session_state,
         )
+        context.add_init_script(STEALTH_JS)
         
+        block_heavy_requests(context)
         page = context.new_page()
         
-        # Advanced stealth script
-        page.add_init_script("""
-            Object.defineProperty(navigator, 'webdriver', {
-                get: () => undefined
-            });
-            
-            window.chrome = {
-                runtime: {},
-                loadTimes: function() {},
-                csi: function() {},
-                app: {}
-            };
-            
-            Object.defineProperty(navigator, 'plugins', {
-                get: () => [1, 2, 3, 4, 5]
-            });
-            
-            Object.defineProperty(navigator, 'languages', {
-                get: () => ['en-US', 'en']
-            });
-            
-            Object.defineProperty(navigator, 'connection', {
-                get: () => ({
-                    effectiveType: '4g',
-                    rtt: 50,
-                    downlink: 10,
-                    saveData: false
-                })
-            });
-            
-            const originalQuery = window.navigator.permissions.query;
-            window.navigator.permissions.query = (parameters) => (
-                parameters.name === 'notifications' ?
-                    Promise.resolve({ state: Notification.permission }) :
-                    originalQuery(parameters)
-            );
-            
-            // Override getBattery if it exists
-            if (navigator.getBattery) {
-                navigator.getBattery = () => Promise.resolve({
-                    charging: true,
-                    chargingTime: 0,
-                    dischargingTime: Infinity,
-                    level: 1
-                });
-            }
-        """)
-        
-        # Set comprehensive headers
-        page.set_extra_http_headers({
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
-            "Accept-Language": "en-US,en;q=0.9,hi;q=0.8",
-            "Accept-Encoding": "gzip, deflate, br, zstd",
-            "Connection": "keep-alive",
-            "Upgrade-Insecure-Requests": "1",
-            "Sec-Fetch-Dest": "document",
-            "Sec-Fetch-Mode": "navigate",
-            "Sec-Fetch-Site": "none",
-            "Sec-Fetch-User": "?1",
-            "Cache-Control": "max-age=0",
-            "DNT": "1",
-            "Pragma": "no-cache"
-        })
-        
-        # Step 1: Visit homepage first to establish session
-        try:
-            print(f"{strategy_name}: Visiting homepage first: {homepage_url}")
-            page.goto(homepage_url, wait_until="domcontentloaded", timeout=30000)
-            page.wait_for_timeout(2000)  # Wait for session to establish
-            
-            # Scroll a bit to simulate human behavior
-            page.evaluate("window.scrollTo(0, 300)")
-            page.wait_for_timeout(1000)
-            page.evaluate("window.scrollTo(0, 0)")
-            page.wait_for_timeout(1000)
-        except Exception as e:
-            print(f"Homepage visit warning: {e}, continuing to product page...")
-        
-        # Step 2: Navigate to actual URL with proper referer
-        page.set_extra_http_headers({
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
-            "Accept-Language": "en-US,en;q=0.9",
-            "Accept-Encoding": "gzip, deflate, br, zstd",
-            "Connection": "keep-alive",
-            "Upgrade-Insecure-Requests": "1",
-            "Sec-Fetch-Dest": "document",
-            "Sec-Fetch-Mode": "navigate",
-            "Sec-Fetch-Site": "same-origin",  # Changed from "none" since we're coming from homepage
-            "Sec-Fetch-User": "?1",
-            "Referer": homepage_url,  # Important: set referer to homepage
-            "Cache-Control": "max-age=0",
-            "DNT": "1"
-        })
+        # Step 1: Visit homepage first to establish session (unless a recent one was saved)
+        if session_state is None:
+            try:
+                print(f"{strategy_name}: Visiting homepage first: {homepage_url}")
+                _visit_homepage(page, homepage_url)  # Returns once the load event has fired
+                _save_session_state(context, homepage_url, "desktop")
+            except Exception as e:
+                print(f"Homepage visit warning: {e}, continuing to product page...")
         
-        # Navigate to target URL
-        url_lower = url.lower()
+        # Step 2: Navigate to actual URL with the homepage as referer (passed per navigation)
+        response = None
         try:
-            if "amazon" in url_lower:
-                page.goto(url, wait_until="domcontentloaded", timeout=60000)
-                page.wait_for_timeout(5000)
-            elif "flipkart" in url_lower:
-                page.goto(url, wait_until="networkidle", timeout=45000)
-                page.wait_for_timeout(3000)
-            elif "meesho" in url_lower:
-                page.goto(url, wait_until="networkidle", timeout=40000)
-                page.wait_for_timeout(3000)
-            elif "ajio" in url_lower:
-                # Ajio needs special handling
-                page.goto(url, wait_until="domcontentloaded", timeout=60000)
-                page.wait_for_timeout(4000)
-                # Scroll to trigger lazy loading
+            # Return as soon as the response starts; wait_until_ready does the actual gating
+            # (networkidle never settles on pages with background analytics pings)
+            response = page.goto(url, referer=homepage_url, wait_until="commit", timeout=60000)
+            wait_until_ready(page, url)
+            if _site_profile(url).get("lazy_scroll"):
+                # Ajio needs special handling: scroll to trigger lazy loading
                 page.evaluate("window.scrollTo(0, 500)")
                 page.wait_for_timeout(2000)
                 page.evaluate("window.scrollTo(0, 0)")
                 page.wait_for_timeout(1000)
-            else:
-                try:
-                    page.goto(url, wait_until="networkidle", timeout=40000)
-                    page.wait_for_timeout(3000)
-                except:
-                    page.goto(url, wait_until="domcontentloaded", timeout=60000)
-                    page.wait_for_timeout(4000)
         except Exception as e:
             print(f"Navigation warning: {e}")
             try:
-                page.goto(url, wait_until="domcontentloaded", timeout=60000)
-                page.wait_for_timeout(3000)
+                response = page.goto(url, referer=homepage_url, wait_until="domcontentloaded", timeout=60000)
+                wait_until_ready(page, url)
             except:
                 pass
         
-        # Check for access denied
-        page_text = page.inner_text("body").lower()
-        if "access denied" in page_text or "you don't have permission" in page_text:
-            raise Exception("Access denied detected")
+        _raise_if_access_denied(response)
         
-        page.wait_for_timeout(2000)
+        _wait_for_load(page, timeout=2000)
         
         # Close any popups before taking screenshot
         _close_popups(page)
         
         # Take screenshot
-        page.screenshot(path=out_path, full_page=True)
-        browser.close()
+        _screenshot_page(page, out_path)
         return out_path
+    finally:
+        if context is not None:
+            context.close()
 
 
 def _capture_with_mobile_ua(url: str, homepage_url: str, out_path: str, viewport, strategy_name="Mobile"):
     """Capture with mobile user agent (often bypasses bot detection)"""
-    from playwright.sync_api import sync_playwright
     
-    with sync_playwright() as p:
-        browser = p.chromium.launch(
-            headless=True,
-            args=['--disable-blink-features=AutomationControlled', '--no-sandbox', '--disable-setuid-sandbox']
-        )
+    context = None
+    try:
+        browser = _get_browser("chromium", headless=True, args=CHROMIUM_ARGS)
+        session_state = _fresh_session_state(homepage_url, "mobile")
         
         context = browser.new_context(
             viewport={"width": 390, "height": 844},
@@ -658,57 +1377,43 @@ def _capture_with_mobile_ua(url: str, homepage_url: str, out_path: str, viewport
             timezone_id="Asia/Kolkata",
             device_scale_factor=2,
             is_mobile=True,
-            has_touch=True
+            has_touch=True,
+            extra_http_headers=MOBILE_HEADERS,
+            storage_state=session_state,
         )
+        context.add_init_script(MOBILE_STEALTH_JS)
         
+        block_heavy_requests(context)
         page = context.new_page()
-        page.add_init_script("""
-            Object.defineProperty(navigator, 'webdriver', { get: () => undefined });
-        """)
-        
-        page.set_extra_http_headers({
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-            "Accept-Language": "en-IN,en;q=0.9",
-            "Accept-Encoding": "gzip, deflate, br",
-            "Referer": homepage_url
-        })
-        
-        try:
-            page.goto(homepage_url, wait_until="domcontentloaded", timeout=30000)
-            page.wait_for_timeout(2000)
-        except:
-            pass
         
-        page.goto(url, wait_until="domcontentloaded", timeout=60000)
-        page.wait_for_timeout(4000)
+        if session_state is None:
+            try:
+                _visit_homepage(page, homepage_url)
+                _save_session_state(context, homepage_url, "mobile")
+            except:
+                pass
         
-        page_text = page.inner_text("body").lower()
-        if "access denied" in page_text or "you don't have permission" in page_text:
-            raise Exception("Access denied detected")
+        response = page.goto(url, referer=homepage_url, wait_until="commit", timeout=60000)
+        wait_until_ready(page, url)
+        _raise_if_access_denied(response)
         
         # Close any popups before taking screenshot
         _close_popups(page)
         
-        page.screenshot(path=out_path, full_page=True)
-        browser.close()
+        _screenshot_page(page, out_path)
         return out_path
+    finally:
+        if context is not None:
+            context.close()
 
 
 def _capture_with_stealth(url: str, homepage_url: str, out_path: str, viewport, strategy_name="Stealth"):
     """Capture with maximum stealth settings"""
-    from playwright.sync_api import sync_playwright
     
-    with sync_playwright() as p:
-        browser = p.chromium.launch(
-            headless=True,
-            args=[
-                '--disable-blink-features=AutomationControlled',
-                '--disable-features=IsolateOrigins,site-per-process',
-                '--no-sandbox',
-                '--disable-setuid-sandbox',
-                '--disable-dev-shm-usage'
-            ]
-        )
+    context = None
+    try:
+        browser = _get_browser("chromium", headless=True, args=CHROMIUM_ARGS)
+        session_state = _fresh_session_state(homepage_url, "stealth")
         
         context = browser.new_context(
             viewport={"width": viewport[0], "height": viewport[1]},
@@ -717,149 +1422,121 @@ def _capture_with_stealth(url: str, homepage_url: str, out_path: str, viewport,
             timezone_id="Asia/Kolkata",
             java_script_enabled=True,
             geolocation={"latitude": 28.6139, "longitude": 77.2090},
-            permissions=["geolocation"]
+            permissions=["geolocation"],
+            extra_http_headers=STANDARD_HEADERS,
+            storage_state=session_state,
         )
+        context.add_init_script(STEALTH_JS)
         
+        block_heavy_requests(context)
         page = context.new_page()
         
-        # Maximum stealth script
-        page.add_init_script("""
-            Object.defineProperty(navigator, 'webdriver', { get: () => false });
-            
-            window.chrome = {
-                runtime: {},
-                loadTimes: function() {},
-                csi: function() {},
-                app: {}
-            };
-            
-            Object.defineProperty(navigator, 'plugins', {
-                get: () => [1, 2, 3, 4, 5]
-            });
-            
-            Object.defineProperty(navigator, 'languages', {
-                get: () => ['en-US', 'en']
-            });
-            
-            Object.defineProperty(navigator, 'connection', {
-                get: () => ({
-                    effectiveType: '4g',
-                    rtt: 50,
-                    downlink: 10
-                })
-            });
-        """)
-        
-        page.set_extra_http_headers({
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-            "Accept-Language": "en-IN,en;q=0.9,en-US;q=0.8",
-            "Accept-Encoding": "gzip, deflate, br, zstd",
-            "Connection": "keep-alive",
-            "Upgrade-Insecure-Requests": "1",
-            "Referer": homepage_url
-        })
-        
-        try:
-            page.goto(homepage_url, wait_until="domcontentloaded", timeout=30000)
-            page.wait_for_timeout(2000)
-        except:
-            pass
-        
-        page.goto(url, wait_until="domcontentloaded", timeout=60000)
-        page.wait_for_timeout(4000)
+        if session_state is None:
+            try:
+                _visit_homepage(page, homepage_url)
+                _save_session_state(context, homepage_url, "stealth")
+            except:
+                pass
         
-        page_text = page.inner_text("body").lower()
-        if "access denied" in page_text or "you don't have permission" in page_text:
-            raise Exception("Access denied detected")
+        response = page.goto(url, referer=homepage_url, wait_until="commit", timeout=60000)
+        wait_until_ready(page, url)
+        _raise_if_access_denied(response)
         
         # Close any popups before taking screenshot
         _close_popups(page)
         
-        page.screenshot(path=out_path, full_page=True)
-        browser.close()
+        _screenshot_page(page, out_path)
         return out_path
+    finally:
+        if context is not None:
+            context.close()
 
 
 def _capture_with_firefox(url: str, homepage_url: str, out_path: str, viewport, strategy_name="Firefox"):
     """Capture using Firefox (different fingerprint)"""
-    from playwright.sync_api import sync_playwright
     
     try:
-        with sync_playwright() as p:
-            browser = p.firefox.launch(headless=True)
+        context = None
+        try:
+            browser = _get_browser("firefox", headless=True)
+            session_state = _fresh_session_state(homepage_url, "firefox")
             
             context = browser.new_context(
                 viewport={"width": viewport[0], "height": viewport[1]},
                 user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:131.0) Gecko/20100101 Firefox/131.0",
                 locale="en-IN",
-                timezone_id="Asia/Kolkata"
+                timezone_id="Asia/Kolkata",
+                extra_http_headers=FIREFOX_HEADERS,
+                storage_state=session_state,
             )
             
+            block_heavy_requests(context)
             page = context.new_page()
-            page.set_extra_http_headers({
-                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-                "Accept-Language": "en-IN,en;q=0.9",
-                "Accept-Encoding": "gzip, deflate, br",
-                "Connection": "keep-alive",
-                "Upgrade-Insecure-Requests": "1",
-                "Referer": homepage_url
-            })
-            
-            try:
-                page.goto(homepage_url, wait_until="domcontentloaded", timeout=30000)
-                page.wait_for_timeout(2000)
-            except:
-                pass
             
-            page.goto(url, wait_until="domcontentloaded", timeout=60000)
-            page.wait_for_timeout(5000)
+            if session_state is None:
+                try:
+                    _visit_homepage(page, homepage_url)
+                    _save_session_state(context, homepage_url, "firefox")
+                except:
+                    pass
             
-            page_text = page.inner_text("body").lower()
-            if "access denied" in page_text or "you don't have permission" in page_text:
-                raise Exception("Access denied detected")
+            response = page.goto(url, referer=homepage_url, wait_until="commit", timeout=60000)
+            wait_until_ready(page, url)
+            _raise_if_access_denied(response)
             
             # Close any popups before taking screenshot
             _close_popups(page)
             
-            page.screenshot(path=out_path, full_page=True)
-            browser.close()
+            _screenshot_page(page, out_path)
             return out_path
+        finally:
+            if context is not None:
+                context.close()
     except Exception as e:
         raise Exception(f"Firefox not available: {e}")
 
 
+# Text of edge/CDN block pages as read by OCR, compiled into one pattern so the OCR
+# output is scanned once however many markers are listed
+DENIED_INDICATORS = (
+    "access denied",
+    "you don't have permission",
+    "reference #",
+    "errors.edgesuite.net",
+)
+_DENIED_RE = re.compile("|".join(re.escape(indicator) for indicator in DENIED_INDICATORS))
+
+
 def _verify_not_access_denied(file_path: str) -> bool:
     """Check if screenshot is NOT an access denied page"""
     try:
-        from PIL import Image
-        import pytesseract
-        
-        # Quick OCR check on screenshot
+        # Block pages are short with the message at the top, so OCR only the top band
+        # at half resolution instead of the whole (often 20000px tall) screenshot
         img = Image.open(file_path)
-        text = pytesseract.image_to_string(img, lang='eng').lower()
+        band = img.crop((0, 0, img.width, min(800, img.height)))
+        band = band.resize((max(1, band.width // 2), max(1, band.height // 2)), Image.BILINEAR)
+        text = pytesseract.image_to_string(band, lang='eng', config='--psm 6').lower()
         
         # Check for access denied indicators
-        denied_indicators = [
-            "access denied",
-            "you don't have permission",
-            "reference #",
-            "errors.edgesuite.net"
-        ]
-        
-        for indicator in denied_indicators:
-            if indicator in text:
-                return False
-        
-        return True
+        return _DENIED_RE.search(text) is None
     except Exception as e:
         print(f"Could not verify screenshot: {e}")
         return True  # Assume valid if we can't check
 
 
-def _capture_myntra(url: str, out_path: str, viewport=(1280, 2000)):
+MYNTRA_HOMEPAGE = "https://www.myntra.com/"
+
+# Only use non-headless if not in headless environment
+# On Windows with display, this will show browser window briefly
+PLAYWRIGHT_HEADLESS = os.environ.get('PLAYWRIGHT_HEADLESS', 'true').lower() == 'true'
+
+
+
+def _capture_myntra(url: str, out_path: str, viewport=(1280, 800)):
     """
     Special handler for Myntra with multiple fallback strategies.
     Myntra has strong bot detection, so we try different approaches.
+    Returns (path, whether a non-blank screenshot was captured).
     """
     print("Using Myntra-specific capture strategy...")
     
@@ -875,15 +1552,20 @@ def _capture_myntra(url: str, out_path: str, viewport=(1280, 2000)):
         # Strategy 5: Chromium with different settings
         lambda: _try_myntra_chromium_alt(url, out_path, viewport),
     ]
+    if PLAYWRIGHT_HEADLESS:
+        # Strategy 1 is then the alt strategy (see _try_myntra_non_headless); running
+        # strategy 5 again last would repeat the same attempt
+        del strategies[4]
     
     for i, strategy in enumerate(strategies, 1):
         try:
             print(f"Trying Myntra strategy {i}...")
-            result = strategy()
+            with _browser_pool.slot():
+                result = strategy()
             # Verify screenshot is not blank
             if result and _verify_screenshot_not_blank(result):
                 print(f"Myntra screenshot captured successfully with strategy {i}")
-                return result
+                return result, True
             else:
                 print(f"Strategy {i} produced blank screenshot, trying next...")
         except Exception as e:
@@ -892,65 +1574,33 @@ def _capture_myntra(url: str, out_path: str, viewport=(1280, 2000)):
     
     # If all fail, return the last attempted path (might be empty but file exists)
     print("Warning: All Myntra strategies failed, screenshot may be blank")
-    return out_path
+    return out_path, False
 
 
 def _verify_screenshot_not_blank(file_path: str, min_content_pixels: int = 1000) -> bool:
     """Check if screenshot has actual content (not just white/blank)"""
     try:
-        from PIL import Image
+        # 8-bit grayscale view of the image; "not white" means below 240
+        gray = np.asarray(Image.open(file_path).convert("L"))
         
-        # Try numpy first (usually available with easyocr)
-        try:
-            import numpy as np
-            
-            img = Image.open(file_path)
-            img_array = np.array(img)
-            
-            # Convert to grayscale if needed
-            if len(img_array.shape) == 3:
-                gray = np.mean(img_array, axis=2)
-            else:
-                gray = img_array
-            
-            # Count non-white pixels (assuming white is close to 255)
-            non_white = np.sum(gray < 240)  # Threshold for "not white"
-            
-            return non_white > min_content_pixels
-        except ImportError:
-            # Fallback: simple check using PIL only
-            img = Image.open(file_path)
-            pixels = list(img.getdata())
-            
-            # Count non-white pixels (RGB values close to 255,255,255)
-            non_white = sum(1 for p in pixels[:10000] if sum(p[:3] if isinstance(p, tuple) else [p]) < 720)
-            # Sample first 10000 pixels for speed
-            
-            return non_white > (min_content_pixels // 10)  # Adjusted threshold for sample
+        # Every 16th row/column first - a page with content passes on 1/256 of the pixels
+        if int((gray[::16, ::16] < 240).sum()) * 256 > min_content_pixels:
+            return True
+        
+        non_white = int((gray < 240).sum())
+        return non_white > min_content_pixels
     except Exception as e:
         print(f"Could not verify screenshot: {e}")
         return True  # Assume valid if we can't check
 
 
-def _try_myntra_chromium_stealth(url: str, out_path: str, viewport=(1280, 2000)):
+def _try_myntra_chromium_stealth(url: str, out_path: str, viewport=(1280, 800)):
     """Try Myntra with Chromium using advanced stealth techniques"""
-    from playwright.sync_api import sync_playwright
     
-    with sync_playwright() as p:
-        browser = p.chromium.launch(
-            headless=True,
-            args=[
-                '--disable-blink-features=AutomationControlled',
-                '--disable-features=IsolateOrigins,site-per-process',
-                '--disable-dev-shm-usage',
-                '--no-sandbox',
-                '--disable-setuid-sandbox',
-                '--disable-web-security',
-                '--disable-gpu',
-                '--disable-software-rasterizer',
-                '--window-size=1920,1080'
-            ]
-        )
+    context = None
+    try:
+        browser = _get_browser("chromium", headless=True, args=CHROMIUM_ARGS)
+        session_state = _fresh_session_state(MYNTRA_HOMEPAGE, "stealth")
         
         context = browser.new_context(
             viewport={"width": viewport[0], "height": viewport[1]},
@@ -960,105 +1610,40 @@ def _try_myntra_chromium_stealth(url: str, out_path: str, viewport=(1280, 2000))
             java_script_enabled=True,
             # Add geolocation for India
             geolocation={"latitude": 28.6139, "longitude": 77.2090},  # Delhi coordinates
-            permissions=["geolocation"]
+            permissions=["geolocation"],
+            extra_http_headers=STANDARD_HEADERS,
+            storage_state=session_state,
         )
+        context.add_init_script(STEALTH_JS)
         
+        block_heavy_requests(context)
         page = context.new_page()
         
-        # Advanced stealth scripts
-        page.add_init_script("""
-            // Remove webdriver
-            Object.defineProperty(navigator, 'webdriver', {
-                get: () => false
-            });
-            
-            // Override chrome
-            window.chrome = {
-                runtime: {},
-                loadTimes: function() {},
-                csi: function() {},
-                app: {}
-            };
-            
-            // Override plugins
-            Object.defineProperty(navigator, 'plugins', {
-                get: () => [1, 2, 3, 4, 5]
-            });
-            
-            // Override languages
-            Object.defineProperty(navigator, 'languages', {
-                get: () => ['en-US', 'en']
-            });
-            
-            // Add connection property
-            Object.defineProperty(navigator, 'connection', {
-                get: () => ({
-                    effectiveType: '4g',
-                    rtt: 50,
-                    downlink: 10
-                })
-            });
-            
-            // Override permissions
-            const originalQuery = window.navigator.permissions.query;
-            window.navigator.permissions.query = (parameters) => (
-                parameters.name === 'notifications' ?
-                    Promise.resolve({ state: Notification.permission }) :
-                    originalQuery(parameters)
-            );
-        """)
-        
-        page.set_extra_http_headers({
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
-            "Accept-Language": "en-IN,en;q=0.9,en-US;q=0.8",
-            "Accept-Encoding": "gzip, deflate, br, zstd",
-            "Connection": "keep-alive",
-            "Upgrade-Insecure-Requests": "1",
-            "Sec-Fetch-Dest": "document",
-            "Sec-Fetch-Mode": "navigate",
-            "Sec-Fetch-Site": "none",
-            "Sec-Fetch-User": "?1",
-            "Cache-Control": "max-age=0",
-            "DNT": "1",
-            "Referer": "https://www.myntra.com/"
-        })
-        
         # Navigate slowly to mimic human behavior
         try:
             # First, visit homepage to establish session (helps bypass bot detection)
-            try:
-                page.goto("https://www.myntra.com/", wait_until="domcontentloaded", timeout=30000)
-                page.wait_for_timeout(2000)
-            except:
-                pass  # Continue even if homepage fails
+            if session_state is None:
+                try:
+                    _visit_homepage(page, MYNTRA_HOMEPAGE)
+                    _save_session_state(context, MYNTRA_HOMEPAGE, "stealth")
+                except:
+                    pass  # Continue even if homepage fails
             
             # Now navigate to product page
             # Try with commit first (faster, less blocking)
             try:
-                page.goto(url, wait_until="commit", timeout=60000)
+                response = page.goto(url, referer=MYNTRA_HOMEPAGE, wait_until="commit", timeout=60000)
             except:
                 # Fallback to domcontentloaded
-                page.goto(url, wait_until="domcontentloaded", timeout=60000)
-            
-            page.wait_for_timeout(3000)
+                response = page.goto(url, referer=MYNTRA_HOMEPAGE, wait_until="domcontentloaded", timeout=60000)
+            _raise_if_access_denied(response)
             
             # Wait for content to load
-            try:
-                page.wait_for_selector("body", timeout=10000)
-            except:
-                pass
+            wait_until_ready(page, url)
             
             # Check if page actually loaded (not blank)
-            try:
-                body_text = page.evaluate("document.body ? document.body.innerText : ''")
-                if not body_text or len(body_text.strip()) < 10:
-                    # Page might be blank, wait more
-                    page.wait_for_timeout(3000)
-                    body_text = page.evaluate("document.body ? document.body.innerText : ''")
-                    if not body_text or len(body_text.strip()) < 10:
-                        raise Exception("Page appears to be blank or blocked")
-            except:
-                pass
+            if not _wait_for_text(page, 10):
+                print("Myntra page still looks blank, capturing anyway")
             
             # Scroll slowly to trigger lazy loading
             page.evaluate("""
@@ -1077,26 +1662,28 @@ def _try_myntra_chromium_stealth(url: str, out_path: str, viewport=(1280, 2000))
             # Continue anyway, might have partial page
         
         # Wait for any remaining content
-        page.wait_for_timeout(2000)
+        _wait_for_load(page, timeout=2000)
         
         # Close any popups before taking screenshot
         _close_popups(page)
         
         # Take screenshot
-        page.screenshot(path=out_path, full_page=True)
-        browser.close()
+        _screenshot_page(page, out_path)
         return out_path
+    finally:
+        if context is not None:
+            context.close()
 
 
-def _try_myntra_firefox(url: str, out_path: str, viewport=(1280, 2000)):
+def _try_myntra_firefox(url: str, out_path: str, viewport=(1280, 800)):
     """Try Myntra with Firefox (sometimes bypasses detection better)"""
-    from playwright.sync_api import sync_playwright
     
     try:
-        with sync_playwright() as p:
+        context = None
+        try:
             # Check if Firefox is available
             try:
-                browser = p.firefox.launch(headless=True)
+                browser = _get_browser("firefox", headless=True)
             except Exception as e:
                 raise Exception(f"Firefox not available: {e}")
             
@@ -1104,45 +1691,36 @@ def _try_myntra_firefox(url: str, out_path: str, viewport=(1280, 2000)):
                 viewport={"width": viewport[0], "height": viewport[1]},
                 user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:131.0) Gecko/20100101 Firefox/131.0",
                 locale="en-IN",
-                timezone_id="Asia/Kolkata"
+                timezone_id="Asia/Kolkata",
+                extra_http_headers=FIREFOX_HEADERS,
             )
             
+            block_heavy_requests(context)
             page = context.new_page()
-            page.set_extra_http_headers({
-                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-                "Accept-Language": "en-IN,en;q=0.9",
-                "Accept-Encoding": "gzip, deflate, br",
-                "Connection": "keep-alive",
-                "Upgrade-Insecure-Requests": "1",
-                "Referer": "https://www.myntra.com/"
-            })
             
-            page.goto(url, wait_until="domcontentloaded", timeout=60000)
-            page.wait_for_timeout(5000)
+            response = page.goto(url, referer=MYNTRA_HOMEPAGE, wait_until="commit", timeout=60000)
+            _raise_if_access_denied(response)
+            wait_until_ready(page, url)
             
             # Close any popups before taking screenshot
             _close_popups(page)
             
-            page.screenshot(path=out_path, full_page=True)
-            browser.close()
+            _screenshot_page(page, out_path)
             return out_path
+        finally:
+            if context is not None:
+                context.close()
     except Exception as e:
         raise Exception(f"Firefox strategy failed: {e}")
 
 
-def _try_myntra_mobile(url: str, out_path: str, viewport=(1280, 2000)):
+def _try_myntra_mobile(url: str, out_path: str, viewport=(1280, 800)):
     """Try Myntra with mobile user agent (mobile sites often have less bot detection)"""
-    from playwright.sync_api import sync_playwright
     
-    with sync_playwright() as p:
-        browser = p.chromium.launch(
-            headless=True,
-            args=[
-                '--disable-blink-features=AutomationControlled',
-                '--no-sandbox',
-                '--disable-setuid-sandbox'
-            ]
-        )
+    context = None
+    try:
+        browser = _get_browser("chromium", headless=True, args=CHROMIUM_ARGS)
+        session_state = _fresh_session_state(MYNTRA_HOMEPAGE, "mobile")
         
         # Use mobile viewport and user agent
         context = browser.new_context(
@@ -1152,164 +1730,208 @@ def _try_myntra_mobile(url: str, out_path: str, viewport=(1280, 2000)):
             timezone_id="Asia/Kolkata",
             device_scale_factor=2,
             is_mobile=True,
-            has_touch=True
+            has_touch=True,
+            extra_http_headers=MOBILE_HEADERS,
+            storage_state=session_state,
         )
+        context.add_init_script(MOBILE_STEALTH_JS)
         
+        block_heavy_requests(context)
         page = context.new_page()
         
-        page.add_init_script("""
-            Object.defineProperty(navigator, 'webdriver', {
-                get: () => undefined
-            });
-        """)
-        
-        page.set_extra_http_headers({
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-            "Accept-Language": "en-IN,en;q=0.9",
-            "Accept-Encoding": "gzip, deflate, br",
-            "Referer": "https://www.myntra.com/"
-        })
-        
         try:
             # Visit homepage first to establish session
-            try:
-                page.goto("https://www.myntra.com/", wait_until="domcontentloaded", timeout=30000)
-                page.wait_for_timeout(2000)
-            except:
-                pass
+            if session_state is None:
+                try:
+                    _visit_homepage(page, MYNTRA_HOMEPAGE)
+                    _save_session_state(context, MYNTRA_HOMEPAGE, "mobile")
+                except:
+                    pass
             
             # Now navigate to product page
-            page.goto(url, wait_until="domcontentloaded", timeout=60000)
-            page.wait_for_timeout(4000)
+            response = page.goto(url, referer=MYNTRA_HOMEPAGE, wait_until="commit", timeout=60000)
+            _raise_if_access_denied(response)
+            wait_until_ready(page, url)
             
-            # Check if content loaded
-            content_check = page.evaluate("document.body && document.body.innerText ? document.body.innerText.length : 0")
-            if content_check < 50:
-                page.wait_for_timeout(3000)
+            # Give the content a moment to render if it hasn't yet
+            _wait_for_text(page, 50)
             
             # Close any popups before taking screenshot
             _close_popups(page)
             
-            page.screenshot(path=out_path, full_page=True)
+            _screenshot_page(page, out_path)
         except Exception as e:
             print(f"Mobile strategy error: {e}")
-            try:
-                page.screenshot(path=out_path, full_page=False)
-            except:
-                raise
+            _screenshot_viewport(page, out_path)
         
-        browser.close()
         return out_path
+    finally:
+        if context is not None:
+            context.close()
 
 
-def _try_myntra_non_headless(url: str, out_path: str, viewport=(1280, 2000)):
+def _try_myntra_non_headless(url: str, out_path: str, viewport=(1280, 800)):
     """Try Myntra with non-headless browser (most realistic, but slower)"""
-    from playwright.sync_api import sync_playwright
-    import os
+    # Set PLAYWRIGHT_HEADLESS=false to see browser (slower but more realistic). Headless,
+    # this would just be another headless Chromium attempt - use the alt strategy instead
+    if PLAYWRIGHT_HEADLESS:
+        return _try_myntra_chromium_alt(url, out_path, viewport)
+    browser = _get_browser("chromium", headless=False, args=CHROMIUM_ARGS)
+    session_state = _fresh_session_state(MYNTRA_HOMEPAGE, "desktop")
     
-    # Only use non-headless if not in headless environment
-    # On Windows with display, this will show browser window briefly
-    use_headless = os.environ.get('PLAYWRIGHT_HEADLESS', 'true').lower() == 'true'
-    
-    with sync_playwright() as p:
-        browser = p.chromium.launch(
-            headless=use_headless,  # Set to False to see browser (slower but more realistic)
-            args=[
-                '--disable-blink-features=AutomationControlled',
-                '--no-sandbox',
-                '--disable-setuid-sandbox',
-                '--start-maximized'
-            ]
-        )
-        
+    def _new_context(browser):
         context = browser.new_context(
-            viewport={"width": viewport[0], "height": viewport[1]},
             user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
             locale="en-IN",
-            timezone_id="Asia/Kolkata"
+            timezone_id="Asia/Kolkata",
+            extra_http_headers=STANDARD_HEADERS,
+            storage_state=session_state,
         )
+        context.add_init_script(STEALTH_JS)
+        block_heavy_requests(context)
+        if session_state is None:
+            # Establish the session once per context, not once per capture
+            try:
+                page = context.new_page()
+                _visit_homepage(page, MYNTRA_HOMEPAGE)
+                _save_session_state(context, MYNTRA_HOMEPAGE, "desktop")
+                page.close()
+            except Exception:
+                context.close()
+                raise
+        return context
+    
+    # First strategy of every Myntra capture: keep its context between captures and only
+    # open a page, so the warm HTTP cache and session carry over
+    context, _ = _browser_pool.get_context(browser, "myntra-desktop", _new_context)
+    page = context.new_page()
+    try:
+        page.set_viewport_size({"width": viewport[0], "height": viewport[1]})
         
-        page = context.new_page()
-        
-        page.add_init_script("""
-            Object.defineProperty(navigator, 'webdriver', { get: () => false });
-            window.chrome = { runtime: {} };
-        """)
-        
-        page.set_extra_http_headers({
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-            "Accept-Language": "en-IN,en;q=0.9",
-            "Referer": "https://www.myntra.com/"
-        })
-        
-        # Navigate to homepage first to establish session
         try:
-            page.goto("https://www.myntra.com/", wait_until="domcontentloaded", timeout=30000)
-            page.wait_for_timeout(2000)
-        
-            # Now navigate to product page
-            page.goto(url, wait_until="domcontentloaded", timeout=60000)
-            page.wait_for_timeout(5000)
+            # Straight to the product page; wait_until_ready waits for the price block
+            response = page.goto(url, referer=MYNTRA_HOMEPAGE, wait_until="commit", timeout=60000)
+            _raise_if_access_denied(response)
+            wait_until_ready(page, url)
             
-            # Verify content
-            content_length = page.evaluate("document.body ? document.body.innerText.length : 0")
-            if content_length < 100:
-                page.wait_for_timeout(3000)
+            # Give the content a moment to render if it hasn't yet
+            _wait_for_text(page, 100)
             
             # Close any popups before taking screenshot
             _close_popups(page)
             
-            page.screenshot(path=out_path, full_page=True)
-        except Exception as e:
-            print(f"Non-headless strategy error: {e}")
-            try:
-                page.screenshot(path=out_path, full_page=False)
-            except:
-                raise
+            _screenshot_page(page, out_path, MYNTRA_CONTENT_SELECTOR, MYNTRA_RATINGS_SELECTOR)
+        except PlaywrightTimeoutError as e:
+            print(f"Non-headless strategy timed out on {url}: {e}")
+            _screenshot_viewport(page, out_path)
         
-        browser.close()
         return out_path
+    finally:
+        page.close()
 
 
-def _try_myntra_chromium_alt(url: str, out_path: str, viewport=(1280, 2000)):
+def _try_myntra_chromium_alt(url: str, out_path: str, viewport=(1280, 800)):
     """Alternative Chromium strategy with minimal settings"""
-    from playwright.sync_api import sync_playwright
+    browser = _get_browser("chromium", headless=True, args=CHROMIUM_ARGS)
     
-    with sync_playwright() as p:
-        browser = p.chromium.launch(
-            headless=True,
-            args=['--no-sandbox', '--disable-setuid-sandbox']
-        )
-        
+    def _new_context(browser):
         context = browser.new_context(
-            viewport={"width": viewport[0], "height": viewport[1]},
             user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36"
         )
-        
-        page = context.new_page()
+        block_heavy_requests(context)
+        return context
+    
+    # Warm context reused across captures (keeps the HTTP cache); cookies are cleared
+    # each time so this strategy still arrives without a session, as it always has
+    context, created = _browser_pool.get_context(browser, "myntra-alt", _new_context)
+    if not created:
+        context.clear_cookies()
+    page = context.new_page()
+    try:
+        page.set_viewport_size({"width": viewport[0], "height": viewport[1]})
         
         try:
-            page.goto(url, wait_until="load", timeout=60000)
-            page.wait_for_timeout(5000)
+            response = page.goto(url, wait_until="commit", timeout=60000)
+            _raise_if_access_denied(response)
+            wait_until_ready(page, url)
             
             # Close any popups before taking screenshot
             _close_popups(page)
             
-            page.screenshot(path=out_path, full_page=True)
-        except:
-            # Close any popups even if navigation failed
-            try:
-                _close_popups(page)
-            except:
-                pass
-            page.screenshot(path=out_path, full_page=False)
+            _screenshot_page(page, out_path)
+        except PlaywrightTimeoutError as e:
+            print(f"Alt strategy timed out on {url}: {e}")
+            # Close any popups even if navigation timed out
+            _close_popups(page)
+            _screenshot_viewport(page, out_path)
         
-        browser.close()
-    return out_path
+        return out_path
+    finally:
+        page.close()
+
+def capture_batch(urls, out_dir: str = "screenshots", max_workers: int = 6):
+    """
+    Capture several URLs concurrently. Each capture_fullpage call waits on its own
+    strategies, while the browser pool's slots bound how many browsers work at once.
+    
+    Returns:
+        dict: url -> screenshot path, or None if that capture raised
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="capture-batch") as executor:
+        futures = {
+            executor.submit(capture_fullpage, url, _batch_out_path(url, out_dir)): url
+            for url in dict.fromkeys(urls)
+        }
+        for future in as_completed(futures):
+            url = futures[future]
+            try:
+                results[url] = future.result()
+            except Exception as e:
+                print(f"Capture failed for {url}: {e}")
+                results[url] = None
+    return results
+
+
+def _batch_out_path(url: str, out_dir: str) -> str:
+    return os.path.join(out_dir, f"{hashlib.sha256(url.encode()).hexdigest()[:16]}.png")
+
+
+def _capture_in_worker(url: str, out_dir: str):
+    """ProcessPoolExecutor task: one URL, on this worker process's own browser pool"""
+    try:
+        return url, capture_fullpage(url, _batch_out_path(url, out_dir))
+    except Exception as e:
+        print(f"Capture failed for {url}: {e}")
+        return url, None
+
+
+def main(urls, out_dir: str = "screenshots", processes: int = None):
+    """
+    Capture a long URL list across worker processes. Each process imports this module and
+    so gets its own browser pool and strategy threads; within a process the captures
+    still run one after another, so Chromium count scales with processes only.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    processes = processes or max(1, (os.cpu_count() or 2) // 2)
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        for url, p in executor.map(_capture_in_worker, dict.fromkeys(urls), itertools.repeat(out_dir)):
+            print("Saved:", p, "<-", url)
+
 
 if __name__ == "__main__":
-    url = "https://www.meesho.com/example-product-url"   # replace
-    p = capture_fullpage(url, "product_page.png")
-    print("Saved:", p)
+    import sys
+    
+    # URLs as arguments, or a file with one URL per line
+    args = sys.argv[1:] or ["https://www.meesho.com/example-product-url"]   # replace
+    if len(args) == 1 and os.path.isfile(args[0]):
+        with open(args[0]) as f:
+            args = [line.strip() for line in f if line.strip()]
+    if len(args) == 1:
+        p = capture_fullpage(args[0], "product_page.png")
+        print("Saved:", p)
+    else:
+        main(args)
 
 
@@ -8,18 +8,21 @@ import numpy as np
 # Uncomment and set path if tesseract is not in PATH
 pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
 
-def preprocess_image_for_ocr(image_path: str, aggressive: bool = False) -> Image.Image:
+def preprocess_image_for_ocr(image_path, aggressive: bool = False) -> Image.Image:
     """
     Preprocess image to improve OCR accuracy, especially for numbers (price/MRP).
     Enhances contrast, sharpness, and converts to grayscale for better text recognition.
     
     Args:
-        image_path: Path to the image file
+        image_path: Path to the image file, or a binary file-like object
         aggressive: If True, applies more aggressive preprocessing (may degrade quality)
     
     Returns:
         PIL.Image: Preprocessed image
     """
+    # File-like inputs are read by both OCR engines, so always start from the top
+    if hasattr(image_path, 'seek'):
+        image_path.seek(0)
     img = Image.open(image_path)
     
     # Convert to RGB if needed (handles RGBA, P, etc.)
@@ -55,14 +58,14 @@ def preprocess_image_for_ocr(image_path: str, aggressive: bool = False) -> Image
     
     return img
 
-def ocr_pytesseract(image_path: str, aggressive: bool = False) -> str:
+def ocr_pytesseract(image_path, aggressive: bool = False) -> str:
     """
     Extract text from image using pytesseract with enhanced preprocessing.
     Optimized for better number recognition (price/MRP).
     Preserves line-by-line structure from the screenshot.
     
     Args:
-        image_path: Path to the image file
+        image_path: Path to the image file, or a binary file-like object
         aggressive: If True, uses aggressive preprocessing (may degrade quality)
     
     Returns:
@@ -106,14 +109,14 @@ _reader_initialized = False
 _read_count = 0
 _MAX_READS_BEFORE_RESET = 50  # Reset reader after 50 reads to prevent memory issues
 
-def ocr_easyocr(image_path: str, lang_list=['en'], force_reset: bool = False) -> str:
+def ocr_easyocr(image_path, lang_list=['en'], force_reset: bool = False) -> str:
     """
     Extract text from image using easyocr with enhanced preprocessing.
     Optimized for better number recognition (price/MRP).
     Preserves line-by-line structure from the screenshot.
     
     Args:
-        image_path: Path to the image file
+        image_path: Path to the image file, or a binary file-like object
         lang_list: List of language codes to use
         force_reset: Force reset of EasyOCR reader (useful if quality degrades)
     
@@ -148,26 +151,10 @@ def ocr_easyocr(image_path: str, lang_list=['en'], force_reset: bool = False) ->
     # Preprocess image for better OCR (use moderate preprocessing)
     img = preprocess_image_for_ocr(image_path, aggressive=False)
     
-    # Save preprocessed image temporarily for EasyOCR
-    import tempfile
-    import os
-    temp_path = None
-    try:
-        with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp_file:
-            temp_path = tmp_file.name
-            img.save(temp_path, 'PNG')
-        
-        # Get detailed results with bounding boxes to preserve line structure
-        # Use allowlist parameter to prioritize numbers and currency symbols for better price/MRP extraction
-        # Include all common characters but prioritize digits
-        results = _reader.readtext(temp_path, detail=1)
-    finally:
-        # Clean up temp file
-        if temp_path and os.path.exists(temp_path):
-            try:
-                os.unlink(temp_path)
-            except:
-                pass
+    # Hand the preprocessed image to EasyOCR as an in-memory array
+    # (readtext accepts numpy arrays, so no temporary PNG is needed)
+    # Get detailed results with bounding boxes to preserve line structure
+    results = _reader.readtext(np.asarray(img), detail=1)
     
     # Sort by vertical position (top to bottom) to maintain line order
     # Then group by similar Y coordinates to form lines
@@ -1,10 +1,12 @@
 import os
 import json
 import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from capture import capture_fullpage
 from ocr import ocr_easyocr, ocr_pytesseract
-from scrape_dom import fetch_dom_text, fetch_dom_with_playwright
-from call_model_hf import call_hf_inference, extract_json_from_response, get_local_model_path
+from scrape_dom import fetch_dom_text, fetch_dom_with_playwright, extract_rating_from_dom
+from call_model_hf import call_hf_inference
 
 # Load config automatically (if not already set)
 try:
@@ -13,6 +15,10 @@ try:
 except ImportError:
     pass  # config.py might not exist in older versions
 
+# Background pool for the independent page loads of a run (screenshot capture,
+# DOM rating lookup) so they overlap with the DOM text fetch
+_fetch_executor = ThreadPoolExecutor(max_workers=8)
+
 # Field definitions - describes how to extract each field
 FIELD_DEFINITIONS = {
     "rating": {
@@ -423,6 +429,20 @@ def run(url, fields=None, use_dom_first=True, use_ocr_fallback=True):
     Returns:
         dict: Extracted data with only the requested fields + source
     """
+    # Each call gets its own screenshot file so concurrent runs (batch endpoints)
+    # don't overwrite each other's capture
+    fd, screenshot_path = tempfile.mkstemp(prefix="tmp_page_", suffix=".png")
+    os.close(fd)
+    try:
+        return _run(url, fields, use_dom_first, use_ocr_fallback, screenshot_path)
+    finally:
+        if os.path.exists(screenshot_path):
+            os.remove(screenshot_path)
+
+def _run(url, fields, use_dom_first, use_ocr_fallback, screenshot_path):
+    """
+    Pipeline body for run(); writes the page capture to screenshot_path.
+    """
     # Set default fields if not provided
     if fields is None:
         fields = ["rating", "review"]
@@ -473,24 +493,11 @@ def run(url, fields=None, use_dom_first=True, use_ocr_fallback=True):
     img_path = None
     
     # ALWAYS capture screenshot for every URL (user requirement)
+    # The capture and the DOM rating lookup are independent page loads, so they run
+    # in the background while the DOM text is fetched on this thread
     print("Capturing screenshot...")
-    try:
-        img_path = capture_fullpage(url, out_path="tmp_page.png")
-        print(f"Screenshot saved to: {img_path}")
-    except Exception as e:
-        print(f"Warning: Screenshot capture failed: {e}")
-        # Continue anyway, will try to use DOM or retry screenshot later
-    
-    # Try to extract rating from DOM attributes (for Flipkart/visual stars)
-    dom_rating = None
-    if use_dom_first:
-        try:
-            from scrape_dom import extract_rating_from_dom
-            dom_rating = extract_rating_from_dom(url)
-            if dom_rating:
-                print(f"Found rating {dom_rating} from DOM attributes")
-        except Exception as e:
-            print(f"DOM rating extraction failed: {e}")
+    capture_future = _fetch_executor.submit(capture_fullpage, url, out_path=screenshot_path)
+    rating_future = _fetch_executor.submit(extract_rating_from_dom, url) if use_dom_first else None
     
     # Try DOM extraction first (more accurate)
     if use_dom_first:
@@ -502,15 +509,31 @@ def run(url, fields=None, use_dom_first=True, use_ocr_fallback=True):
                 print("DOM text too short, trying Playwright...")
                 extracted_text = fetch_dom_with_playwright(url)
                 source = "dom"
-            
-            # If we found rating in DOM, prepend it to extracted text
-            if dom_rating:
-                extracted_text = f"Rating: {dom_rating} stars\n{extracted_text}"
-            
         except Exception as e:
             print(f"DOM extraction failed: {e}")
             use_ocr_fallback = True
     
+    try:
+        img_path = capture_future.result()
+        print(f"Screenshot saved to: {img_path}")
+    except Exception as e:
+        print(f"Warning: Screenshot capture failed: {e}")
+        # Continue anyway, will try to use DOM or retry screenshot later
+    
+    # Try to extract rating from DOM attributes (for Flipkart/visual stars)
+    dom_rating = None
+    if rating_future is not None:
+        try:
+            dom_rating = rating_future.result()
+            if dom_rating:
+                print(f"Found rating {dom_rating} from DOM attributes")
+        except Exception as e:
+            print(f"DOM rating extraction failed: {e}")
+    
+    # If we found rating in DOM, prepend it to extracted text
+    if dom_rating and source == "dom":
+        extracted_text = f"Rating: {dom_rating} stars\n{extracted_text}"
+    
     # OCR fallback or if DOM text is insufficient
     if use_ocr_fallback or len(extracted_text.strip()) < 50:
         try:
@@ -518,7 +541,7 @@ def run(url, fields=None, use_dom_first=True, use_ocr_fallback=True):
             # If screenshot wasn't captured earlier, try again
             if img_path is None:
                 try:
-                    img_path = capture_fullpage(url, out_path="tmp_page.png")
+                    img_path = capture_fullpage(url, out_path=screenshot_path)
                     print(f"Screenshot saved to: {img_path}")
                 except Exception as e:
                     print(f"OCR screenshot capture failed: {e}")
@@ -744,18 +767,12 @@ def process_extracted_text(extracted_text, fields, source, fallback_rating=None,
         # Try local model first, fallback to API if it fails
         api_key = os.environ.get("HF_TOKEN") or os.environ.get("MISTRAL_API_KEY")
         
-        # Check if local model is available
-        local_model_available = get_local_model_path() is not None
-        
         # Detect if we should use Mistral API
         use_mistral = api_key and not api_key.startswith("hf_")
         
-        out = call_hf_inference(prompt, use_mistral_api=use_mistral)
-        
-        is_local = isinstance(out, dict) and "generated_text" in out and local_model_available
-        is_mistral = use_mistral and not is_local
-        
-        model_txt = extract_json_from_response(out, is_mistral=is_mistral, is_local=is_local)
+        # The extractor matches whichever backend produced the response
+        out, extract_text = call_hf_inference(prompt, use_mistral_api=use_mistral)
+        model_txt = extract_text(out)
         
         # Debug: print FULL model response (safely handle Unicode)
         print(f"\n{'='*60}")
@@ -879,7 +896,7 @@ def process_extracted_text(extracted_text, fields, source, fallback_rating=None,
 
 def run_on_image(image_path, fields=None):
     """
-    Run extraction on an existing image file.
+    Run extraction on an existing image file (path or binary file-like object).
     """
     if fields is None: fields = ["rating", "review"]
     elif isinstance(fields, str): fields = [fields]
@@ -903,7 +920,7 @@ def run_on_image(image_path, fields=None):
     
     try:
         source = "ocr"
-        print(f"Extracting text from image: {image_path}")
+        print(f"Extracting text from image: {image_path if isinstance(image_path, str) else 'uploaded file'}")
         try:
             easyocr_text = ocr_easyocr(image_path, lang_list=['en'])
         except Exception as e:
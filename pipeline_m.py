@@ -6,7 +6,7 @@ import webbrowser
 from capture import capture_fullpage
 from ocr import ocr_easyocr, ocr_pytesseract
 from scrape_dom import fetch_dom_text, fetch_dom_with_playwright
-from call_model_hf import call_hf_inference, extract_json_from_response
+from call_model_hf import call_hf_inference
 
 # Prompt template for review extraction
 REVIEW_PROMPT_TEMPLATE = """Extract rating, ratings count, reviews count, and customer review from the FULL extracted text (may contain OCR errors).
@@ -257,23 +257,13 @@ def run(url, use_dom_first=True, use_ocr_fallback=True):
         # Try local model first, fallback to API if it fails
         api_key = os.environ.get("HF_TOKEN") or os.environ.get("MISTRAL_API_KEY")
         
-        # Check if local model is available
-        from call_model_hf import get_local_model_path
-        local_model_available = get_local_model_path() is not None
-        
         # Detect if we should use Mistral API (if token exists and doesn't start with "hf_")
         use_mistral = api_key and not api_key.startswith("hf_")
         
-        # call_hf_inference will try local model first, then fallback to API
-        # We'll determine which one was used based on the response structure
-        out = call_hf_inference(prompt, use_mistral_api=use_mistral)
-        
-        # Determine if response came from local model or API
-        # Local model returns {"generated_text": "..."}, API returns different structure
-        is_local = isinstance(out, dict) and "generated_text" in out and local_model_available
-        is_mistral = use_mistral and not is_local
-        
-        model_txt = extract_json_from_response(out, is_mistral=is_mistral, is_local=is_local)
+        # call_hf_inference will try local model first, then fallback to API,
+        # and returns the extractor for whichever backend answered
+        out, extract_text = call_hf_inference(prompt, use_mistral_api=use_mistral)
+        model_txt = extract_text(out)
         
         print(f"\nModel response preview (first 500 chars):")
         print(model_txt[:500])
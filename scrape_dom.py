@@ -1,5 +1,38 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
+from capture import BODY_TEXT_HEAD_JS, STEALTH_JS, block_heavy_requests, run_with_browser, wait_until_ready
+
+# Shared connection pool: keep-alive sockets are reused across fetches instead of
+# paying a TCP + TLS handshake per request. Sessions mounting it must not be closed,
+# since Session.close() would also close the shared adapter.
+_http_adapter = HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=32,
+    max_retries=Retry(total=2, backoff_factor=0.3)
+)
+
+# Upper bound on the (decompressed) HTML read from a product page
+MAX_PAGE_BYTES = 25 * 1024 * 1024
+
+# For each selector, the text (or aria-label) of its first 5 matches - one round trip
+# for the whole list instead of a query plus per-element reads for each selector
+SELECTOR_TEXTS_JS = """(selectors) => selectors.map(selector => {
+    try {
+        return Array.from(document.querySelectorAll(selector)).slice(0, 5)
+            .map(el => el.innerText || el.getAttribute('aria-label') || '');
+    } catch (e) {
+        return [];
+    }
+})"""
+
+def _new_session():
+    """Create a cookie-isolated session backed by the shared connection pool"""
+    session = requests.Session()
+    session.mount("https://", _http_adapter)
+    session.mount("http://", _http_adapter)
+    return session
 
 def fetch_dom_text(url):
     """
@@ -33,8 +66,8 @@ def fetch_dom_text(url):
         "DNT": "1"
     }
     
-    # Create session to maintain cookies
-    session = requests.Session()
+    # Create session to maintain cookies (connections come from the shared pool)
+    session = _new_session()
     
     # First visit homepage to establish session
     try:
@@ -42,54 +75,55 @@ def fetch_dom_text(url):
     except:
         pass  # Continue even if homepage fails
     
-    # Now fetch the actual URL
-    r = session.get(url, headers=headers, timeout=30)
+    # Now fetch the actual URL, streaming so oversized responses are cut off early
+    r = session.get(url, headers=headers, timeout=30, stream=True)
     r.raise_for_status()
     
+    content_length = int(r.headers.get("Content-Length") or 0)
+    if content_length > MAX_PAGE_BYTES:
+        r.close()
+        raise ValueError(f"Page too large: {content_length} bytes (limit {MAX_PAGE_BYTES})")
+    
+    body = bytearray()
+    for chunk in r.iter_content(65536):
+        body.extend(chunk)
+        if len(body) > MAX_PAGE_BYTES:
+            r.close()
+            raise ValueError(f"Page exceeded {MAX_PAGE_BYTES} bytes while downloading")
+    html = body.decode(r.encoding or "utf-8", errors="replace")
+    
     # Check for access denied
-    if "access denied" in r.text.lower() or "you don't have permission" in r.text.lower():
+    html_lower = html.lower()
+    if "access denied" in html_lower or "you don't have permission" in html_lower:
         raise Exception("Access denied error detected")
     
-    soup = BeautifulSoup(r.text, "html.parser")
+    soup = BeautifulSoup(html, "html.parser")
     return soup.get_text(separator="\n")
 
-def fetch_dom_with_playwright(url):
+def _open_product_page(browser, url):
     """
-    Fetch DOM content using Playwright (handles JS-rendered content).
-    Uses advanced techniques to bypass access denied errors.
-    
-    Args:
-        url: The URL to fetch
-    
-    Returns:
-        str: Extracted text from the page
+    Open url in a fresh context of the given (pooled) browser, visiting the homepage first
+    to establish a session. Returns (context, page); the caller closes the context.
     """
-    from playwright.sync_api import sync_playwright
     from urllib.parse import urlparse
     
     parsed_url = urlparse(url)
     domain = f"{parsed_url.scheme}://{parsed_url.netloc}"
     homepage_url = f"{domain}/"
     
-    with sync_playwright() as p:
-        browser = p.chromium.launch(
-            headless=True,
-            args=['--disable-blink-features=AutomationControlled', '--no-sandbox', '--disable-setuid-sandbox']
-        )
-        context = browser.new_context(
-            viewport={"width": 1280, "height": 2000},
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
-            locale="en-US",
-            timezone_id="Asia/Kolkata"
-        )
+    context = browser.new_context(
+        viewport={"width": 1280, "height": 2000},
+        user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
+        locale="en-US",
+        timezone_id="Asia/Kolkata"
+    )
+    try:
+        # Remove webdriver property (shared stealth script, installed once for the context)
+        context.add_init_script(STEALTH_JS)
+        # Only the DOM is read here, so images can be skipped along with fonts/media/trackers
+        block_heavy_requests(context, block_images=True)
         page = context.new_page()
         
-        # Remove webdriver property
-        page.add_init_script("""
-            Object.defineProperty(navigator, 'webdriver', { get: () => undefined });
-            window.chrome = { runtime: {} };
-        """)
-        
         headers = {
             "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
             "Accept-Language": "en-US,en;q=0.9",
@@ -108,7 +142,8 @@ def fetch_dom_with_playwright(url):
         # Visit homepage first to establish session
         try:
             page.goto(homepage_url, wait_until="domcontentloaded", timeout=30000)
-            page.wait_for_timeout(2000)
+            # Session cookies are set by the time the load event fires (bounded wait)
+            page.wait_for_load_state("load", timeout=5000)
         except:
             pass
         
@@ -117,20 +152,46 @@ def fetch_dom_with_playwright(url):
         headers["Sec-Fetch-Site"] = "same-origin"
         page.set_extra_http_headers(headers)
         
-        # Navigate to target URL
-        page.goto(url, wait_until="networkidle", timeout=30000)
-        page.wait_for_timeout(2000)  # Wait for dynamic content
-        
+        # Navigate to target URL. Not networkidle: analytics beacons on these shops keep
+        # the network busy, so that only ever ended at the timeout. Give the network a
+        # short chance to settle, then wait for the product content itself.
+        page.goto(url, wait_until="domcontentloaded", timeout=30000)
+        try:
+            page.wait_for_load_state("networkidle", timeout=3000)
+        except Exception:
+            pass
+        wait_until_ready(page, url)
+        return context, page
+    except:
+        context.close()
+        raise
+
+def fetch_dom_with_playwright(url):
+    """
+    Fetch DOM content using Playwright (handles JS-rendered content).
+    Uses advanced techniques to bypass access denied errors.
+    
+    Args:
+        url: The URL to fetch
+    
+    Returns:
+        str: Extracted text from the page
+    """
+    content = run_with_browser(lambda browser: _rendered_html(browser, url))
+    soup = BeautifulSoup(content, "html.parser")
+    return soup.get_text(separator="\n")
+
+def _rendered_html(browser, url):
+    context, page = _open_product_page(browser, url)
+    try:
         # Check for access denied
-        page_text = page.inner_text("body").lower()
+        page_text = page.evaluate(BODY_TEXT_HEAD_JS)
         if "access denied" in page_text or "you don't have permission" in page_text:
             raise Exception("Access denied error detected")
         
-        content = page.content()
-        browser.close()
-    
-    soup = BeautifulSoup(content, "html.parser")
-    return soup.get_text(separator="\n")
+        return page.content()
+    finally:
+        context.close()
 
 def extract_rating_from_dom(url):
     """
@@ -143,121 +204,66 @@ def extract_rating_from_dom(url):
     Returns:
         float or None: Rating value if found, None otherwise
     """
-    from playwright.sync_api import sync_playwright
-    from urllib.parse import urlparse
+    try:
+        return run_with_browser(lambda browser: _rating_from_page(browser, url))
+    except Exception as e:
+        print(f"Error extracting rating from DOM: {e}")
+        return None
+
+def _rating_from_page(browser, url):
     import re
     
+    context, page = _open_product_page(browser, url)
     try:
-        parsed_url = urlparse(url)
-        domain = f"{parsed_url.scheme}://{parsed_url.netloc}"
-        homepage_url = f"{domain}/"
+        # Check for access denied
+        page_text = page.evaluate(BODY_TEXT_HEAD_JS)
+        if "access denied" in page_text or "you don't have permission" in page_text:
+            return None
         
-        with sync_playwright() as p:
-            browser = p.chromium.launch(
-                headless=True,
-                args=['--disable-blink-features=AutomationControlled', '--no-sandbox', '--disable-setuid-sandbox']
-            )
-            context = browser.new_context(
-                viewport={"width": 1280, "height": 2000},
-                user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
-                locale="en-US",
-                timezone_id="Asia/Kolkata"
-            )
-            page = context.new_page()
-            
-            # Remove webdriver property
-            page.add_init_script("""
-                Object.defineProperty(navigator, 'webdriver', { get: () => undefined });
-                window.chrome = { runtime: {} };
-            """)
-            
-            headers = {
-                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
-                "Accept-Language": "en-US,en;q=0.9",
-                "Accept-Encoding": "gzip, deflate, br, zstd",
-                "Connection": "keep-alive",
-                "Upgrade-Insecure-Requests": "1",
-                "Sec-Fetch-Dest": "document",
-                "Sec-Fetch-Mode": "navigate",
-                "Sec-Fetch-Site": "none",
-                "Sec-Fetch-User": "?1",
-                "Cache-Control": "max-age=0",
-                "DNT": "1"
-            }
-            page.set_extra_http_headers(headers)
-            
-            # Visit homepage first to establish session
-            try:
-                page.goto(homepage_url, wait_until="domcontentloaded", timeout=30000)
-                page.wait_for_timeout(2000)
-            except:
-                pass
-            
-            # Update headers with referer
-            headers["Referer"] = homepage_url
-            headers["Sec-Fetch-Site"] = "same-origin"
-            page.set_extra_http_headers(headers)
-            
-            page.goto(url, wait_until="networkidle", timeout=30000)
-            page.wait_for_timeout(2000)
-            
-            # Check for access denied
-            page_text = page.inner_text("body").lower()
-            if "access denied" in page_text or "you don't have permission" in page_text:
-                browser.close()
-                return None
-            
-            # Try various selectors to find rating
-            rating = None
-            
-            # Try Flipkart-specific patterns
-            if "flipkart" in url.lower():
-                selectors = [
-                    '[class*="XQDdHH"]',  # Common Flipkart rating class
-                    '[class*="Rating"]',
-                    '[class*="rating"]',
-                    '[itemprop="ratingValue"]',
-                    '[aria-label*="rating"]',
-                    '[aria-label*="Rating"]',
-                ]
-                for selector in selectors:
-                    try:
-                        elements = page.query_selector_all(selector)
-                        for elem in elements[:5]:  # Check first 5 matches
-                            text = elem.inner_text() or elem.get_attribute("aria-label") or ""
-                            # Look for decimal number 0-5
-                            match = re.search(r'(\d+\.?\d*)', text)
-                            if match:
-                                val = float(match.group(1))
-                                if 0 <= val <= 5:
-                                    rating = val
-                                    break
-                        if rating:
-                            break
-                    except:
-                        continue
-            
-            # Try generic patterns for other sites
-            if not rating:
-                # Look in text content for rating patterns
-                page_text = page.inner_text("body")
-                patterns = [
-                    r'(\d+\.?\d*)\s*(?:out\s+of\s+5|stars?|★|⭐)',
-                    r'(\d+\.?\d*)\s*\/\s*5',
-                ]
-                for pattern in patterns:
-                    match = re.search(pattern, page_text, re.IGNORECASE)
+        # Try various selectors to find rating
+        rating = None
+        
+        # Try Flipkart-specific patterns
+        if "flipkart" in url.lower():
+            selectors = [
+                '[class*="XQDdHH"]',  # Common Flipkart rating class
+                '[class*="Rating"]',
+                '[class*="rating"]',
+                '[itemprop="ratingValue"]',
+                '[aria-label*="rating"]',
+                '[aria-label*="Rating"]',
+            ]
+            for texts in page.evaluate(SELECTOR_TEXTS_JS, selectors):
+                for text in texts:  # First 5 matches of the selector
+                    # Look for decimal number 0-5
+                    match = re.search(r'(\d+\.?\d*)', text)
                     if match:
                         val = float(match.group(1))
                         if 0 <= val <= 5:
                             rating = val
                             break
-            
-            browser.close()
-            return rating
-    except Exception as e:
-        print(f"Error extracting rating from DOM: {e}")
-        return None
+                if rating:
+                    break
+        
+        # Try generic patterns for other sites
+        if not rating:
+            # Look in text content for rating patterns
+            page_text = page.inner_text("body")
+            patterns = [
+                r'(\d+\.?\d*)\s*(?:out\s+of\s+5|stars?|★|⭐)',
+                r'(\d+\.?\d*)\s*\/\s*5',
+            ]
+            for pattern in patterns:
+                match = re.search(pattern, page_text, re.IGNORECASE)
+                if match:
+                    val = float(match.group(1))
+                    if 0 <= val <= 5:
+                        rating = val
+                        break
+        
+        return rating
+    finally:
+        context.close()
 
 if __name__=="__main__":
     url = "https://www.meesho.com/example-product-url"
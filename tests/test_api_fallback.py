@@ -0,0 +1,69 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import requests
+    import call_model_hf
+except ImportError:
+    requests = None
+
+MISTRAL_KEY = "mistral-test-key"
+HF_TOKEN = "hf_test_token"
+
+
+def _http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    error = requests.exceptions.HTTPError(f"{status} error")
+    error.response = response
+    return error
+
+
+@unittest.skipIf(requests is None, "requests not installed")
+class MistralFallbackTest(unittest.TestCase):
+    """call_hf_inference: what a Mistral API 401 / 429 does to the HF fallback"""
+
+    def _call(self, status, hf_token):
+        keys = {MISTRAL_KEY: "mistral", HF_TOKEN: "hf"}
+        with mock.patch.object(call_model_hf, "get_local_model_path", return_value=None), \
+             mock.patch.object(call_model_hf, "get_mistral_api_key", return_value=MISTRAL_KEY), \
+             mock.patch.object(call_model_hf, "get_hf_token", return_value=hf_token), \
+             mock.patch.object(call_model_hf, "_classify_key", side_effect=lambda key: keys.get(key)), \
+             mock.patch.object(call_model_hf, "call_mistral_api", side_effect=_http_error(status)) as mistral, \
+             mock.patch.object(call_model_hf, "call_hf_api", return_value={"generated_text": "{}"}) as hf:
+            try:
+                return call_model_hf.call_hf_inference("prompt"), mistral, hf
+            except requests.exceptions.HTTPError as e:
+                return e, mistral, hf
+
+    def test_429_falls_back_to_hf(self):
+        result, mistral, hf = self._call(429, HF_TOKEN)
+        mistral.assert_called_once()
+        hf.assert_called_once()
+        self.assertIs(result[1], call_model_hf._extract_hf)
+
+    def test_429_without_hf_token_explains_rate_limit(self):
+        result, _, hf = self._call(429, None)
+        hf.assert_not_called()
+        self.assertIsInstance(result, requests.exceptions.HTTPError)
+        self.assertIn("429 Too Many Requests", str(result))
+        self.assertEqual(result.response.status_code, 429)
+
+    def test_401_does_not_fall_back(self):
+        result, _, hf = self._call(401, HF_TOKEN)
+        hf.assert_not_called()
+        self.assertIsInstance(result, requests.exceptions.HTTPError)
+        self.assertIn("401 Unauthorized", str(result))
+
+    def test_other_errors_fall_back_to_hf(self):
+        result, _, hf = self._call(500, HF_TOKEN)
+        hf.assert_called_once()
+        self.assertIs(result[1], call_model_hf._extract_hf)
+
+
+if __name__ == "__main__":
+    unittest.main()
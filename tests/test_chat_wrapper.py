@@ -0,0 +1,57 @@
+import os
+import sys
+import unittest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+try:
+    import transformers
+    import call_model_hf
+except ImportError:
+    transformers = None
+
+SAMPLES = [
+    "Extract the product details as JSON.",
+    " {\"price\": \"₹874\"}\n",
+    "\nhello",
+    "  two spaces",
+    "₹874 only",
+    "tab\tx",
+    "",
+]
+
+
+@unittest.skipIf(transformers is None, "transformers / requests not installed")
+class ChatWrapperTest(unittest.TestCase):
+    """The cached prefix/suffix splice must give the same ids as the chat template"""
+
+    @classmethod
+    def setUpClass(cls):
+        tokenizer = transformers.AutoTokenizer.from_pretrained(REPO_ROOT, local_files_only=True)
+        call_model_hf._local_tokenizer = tokenizer
+        call_model_hf._has_chat_template = tokenizer.chat_template is not None
+        cls.wrapper = call_model_hf._tokenize_chat_wrapper()
+        call_model_hf._prefix_ids, call_model_hf._prompt_seam, call_model_hf._suffix_ids = cls.wrapper
+
+    def test_wrapper_is_cached(self):
+        self.assertIsNotNone(self.wrapper[0])
+
+    def test_single_bos(self):
+        ids = call_model_hf._encode_local_prompt(SAMPLES[0])
+        bos = call_model_hf._local_tokenizer.bos_token_id
+        self.assertEqual(ids[0], bos)
+        self.assertNotEqual(ids[1], bos)
+
+    def test_splice_matches_apply_chat_template(self):
+        for prompt in SAMPLES:
+            with self.subTest(prompt=prompt):
+                expected = call_model_hf._local_tokenizer.apply_chat_template(
+                    [{"role": "user", "content": prompt}], tokenize=True, add_generation_prompt=True)
+                if not isinstance(expected, list):
+                    expected = expected["input_ids"]
+                self.assertEqual(call_model_hf._encode_local_prompt(prompt), list(expected))
+
+
+if __name__ == "__main__":
+    unittest.main()
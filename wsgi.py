@@ -0,0 +1,15 @@
+"""
+WSGI entry point for running the web app under a production server.
+
+Linux/macOS (gunicorn):
+    gunicorn -w 4 -k gthread --threads 8 --timeout 600 wsgi:application
+
+Windows (waitress):
+    waitress-serve --threads=16 --port=5010 wsgi:application
+
+Each gunicorn worker is a separate process with its own copy of the local model,
+so use -w 1 (and more --threads) when the local Mistral weights are in use.
+"""
+from app import app
+
+application = app